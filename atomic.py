@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Files written whole or not at all. Datasheets, cache entries and recorded
+trajectories are read (or mapped) by other processes while they are being
+rewritten, and a write can be interrupted part way, so each is written to a
+temporary file next to it and moved over it in one step.
+"""
+
+import contextlib
+import os
+import unittest
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    """
+    A file to write path through, opened in mode. It replaces path once the
+    block is done, and is thrown away if the block raises, leaving path as
+    it was.
+    """
+
+    # by process, so two writing the same path don't share a temporary file
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+
+    try:
+        with open(tmp_file, mode) as file:
+            yield file
+
+        os.replace(tmp_file, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_file)
+
+        raise
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'file')
+
+        with open(self.path, 'w') as file:
+            file.write('old')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_replaces(self):
+        with atomic_write(self.path) as file:
+            file.write('new')
+
+            with open(self.path) as old:
+                self.assertEqual(old.read(), 'old')
+
+        with open(self.path) as file:
+            self.assertEqual(file.read(), 'new')
+
+        self.assertEqual(os.listdir(self.tmp.name), ['file'])
+
+    def test_interrupted(self):
+        with self.assertRaises(ValueError):
+            with atomic_write(self.path, 'wb') as file:
+                file.write(b'half')
+                raise ValueError
+
+        with open(self.path) as file:
+            self.assertEqual(file.read(), 'old')
+
+        self.assertEqual(os.listdir(self.tmp.name), ['file'])
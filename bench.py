@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the solver over every kinematics datasheet and the patrol and
+firebird fixtures of sim.py.
+
+For each bike it times Bike.from_datasheet, leverage_curve and
+quantized_leverage_curve, counts solver iterations, measures peak memory and
+how far the curve is from the one stored in the datasheet. Results go to a
+json file, and are compared against a baseline one to flag regressions.
+
+    ./bench.py [datasheets, globs or --all] [--out=bench.json]
+               [--baseline=FILE] [--repeat=5] [--tolerance=0.2] [--floor=0.03]
+"""
+
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import sim
+
+from bikes import batch_args, kinematics_datasheets, store
+from cache import CURVE_TOLERANCE
+from sim import Bike, SweepStats, leverage_curve, quantized_leverage_curve
+
+
+# times are the best of this many runs
+REPEAT = 5
+
+# slowdowns of less than this many seconds are noise: best of 5 runs of an
+# unchanged tree moved by up to ~22ms from one bench to the next
+NOISE_FLOOR = 0.03
+
+
+def fixture(make):
+    """
+    Load a sim.py fixture with the engine Bike.from_datasheet would pick
+    """
+
+    def load():
+        bike = make()
+        bike.platform.engine = bike.default_engine()
+        return bike
+
+    return load
+
+
+FIXTURES = {
+    'patrol': fixture(sim.patrol),
+    'firebird': fixture(sim.firebird),
+}
+
+
+def pipeline(load, resolution=6):
+    """
+    Run load -> leverage_curve -> quantized_leverage_curve once. Returns the
+    seconds each took, the solver iterations of the sweep, the engine and
+    the quantized curve.
+    """
+
+    times = {}
+
+    start = time.perf_counter()
+    bike = load()
+    times['load'] = time.perf_counter() - start
+
+    stats = SweepStats()
+    start = time.perf_counter()
+    leverage_curve(bike, stats=stats)
+    times['leverage_curve'] = time.perf_counter() - start
+
+    # the quantized curve sweeps again, from a bike at rest
+    bike = load()
+    start = time.perf_counter()
+    curve = quantized_leverage_curve(bike, resolution=resolution, normalized=True)[1]
+    times['quantized_leverage_curve'] = time.perf_counter() - start
+
+    return times, sum(stats.iterations), bike.platform.engine, curve
+
+
+def bench(load, stored_curve=None, repeat=REPEAT):
+    resolution = len(stored_curve) if stored_curve else 6
+
+    runs = [pipeline(load, resolution) for _ in range(repeat)]
+
+    # memory on a run of its own, tracing slows everything down
+    tracemalloc.start()
+    pipeline(load, resolution)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times, iterations, engine, curve = runs[0]
+    deviation = None
+
+    if stored_curve:
+        deviation = max(abs(a - b) for a, b in zip(curve, stored_curve))
+
+    return {
+        'engine': engine,
+        # best of the repeats, the rest is noise
+        'times': {
+            phase: min(run[0][phase] for run in runs) for phase in times
+        },
+        'iterations': iterations,
+        'peak_memory': peak_memory,
+        'deviation': deviation,
+    }
+
+
+def regressions(results, baseline, tolerance, floor=NOISE_FLOOR):
+    """
+    Everything in results that got slower by more than tolerance (a
+    fraction) and floor seconds, took more iterations, or moved away from
+    the stored curve
+    """
+
+    found = []
+
+    for name, result in results.items():
+        before = baseline.get(name)
+
+        if before is None:
+            continue
+
+        for phase, seconds in result['times'].items():
+            was = before['times'].get(phase)
+            if was and seconds > was * (1 + tolerance) and seconds - was > floor:
+                found.append(f'{name}: {phase} {was:.3f}s -> {seconds:.3f}s')
+
+        if result['iterations'] > before['iterations']:
+            found.append(f'{name}: iterations {before["iterations"]} -> {result["iterations"]}')
+
+        if result['peak_memory'] > before['peak_memory'] * (1 + tolerance):
+            found.append(f'{name}: peak memory {before["peak_memory"]} -> {result["peak_memory"]}')
+
+        if result['deviation'] is not None and before['deviation'] is not None \
+                and result['deviation'] > before['deviation'] + CURVE_TOLERANCE:
+            found.append(f'{name}: deviation {before["deviation"]:.2g} -> {result["deviation"]:.2g}')
+
+    return found
+
+
+def main(args):
+    datasheets, _jobs, options = batch_args(args, default=kinematics_datasheets([]))
+    repeat = int(options.get('repeat', REPEAT))
+    results = {}
+
+    # read before anything is written, the baseline may well be the last --out
+    baseline = None
+    if 'baseline' in options:
+        with open(options['baseline']) as file:
+            baseline = json.loads(file.read())['results']
+
+    for name, fixture in FIXTURES.items():
+        results[name] = bench(fixture, repeat=repeat)
+        print(f'{name:<50} {sum(results[name]["times"].values()):>8.3f}s')
+
+    for datasheet in datasheets:
+        stored_curve = store.read(datasheet).get('curve')
+        # parsing the datasheet is part of loading it
+        load = lambda: Bike.from_datasheet(datasheet)
+        results[datasheet] = bench(load, stored_curve, repeat)
+        print(f'{datasheet:<50} {sum(results[datasheet]["times"].values()):>8.3f}s')
+
+    report = {
+        'python': platform.python_version(),
+        'solver_version': sim.SOLVER_VERSION,
+        'results': results,
+    }
+
+    with open(options.get('out', 'bench.json'), 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if baseline is None:
+        return 0
+
+    found = regressions(
+        results,
+        baseline,
+        float(options.get('tolerance', 0.2)),
+        float(options.get('floor', NOISE_FLOOR)),
+    )
+
+    for regression in found:
+        print(f'REGRESSION {regression}')
+
+    print(f'{len(found)} regressions against {options["baseline"]}')
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
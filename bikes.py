@@ -1,16 +1,58 @@
 #!/usr/bin/env python3
 
+import atexit
+import functools
+import glob
 import os
 import json
 import sys
+import time
 import webbrowser
 
-from sim import Bike, quantized_leverage_curve, draw
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import schema
+import timing
+
+from atomic import atomic_write
+from cache import CurveCache, curve_key, curves_differ
+from store import DatasheetStore
+from sim import (
+    Bike,
+    SweepStats,
+    Trajectory,
+    draw,
+    export,
+    leverage_curve,
+    leverage_uncertainty,
+    quantize,
+    shock_leverage_curves,
+    tune_solver,
+)
+
+
+# parsed datasheets, only the ones that changed since the last command are
+# parsed again
+store = DatasheetStore()
+atexit.register(store.save)
+
+
+def kinematics_datasheets(args):
+    """
+    The datasheet files given, or every datasheet with kinematics if none are
+    """
+
+    if args:
+        return args
+
+    return [
+        store.file(id) for id in store.ids()
+        if store.get(id).get('kinematics') is not None
+    ]
 
 
 def add_bike(_args):
-    with open('datasheets/reference.json') as file:
-        reference_data = json.loads(file.read())
+    reference_data = store.get('reference')
 
     exclude = ['kinematics', 'curve']
 
@@ -47,7 +89,7 @@ def add_bike(_args):
     default_datasheet_name = default_datasheet_name.replace(".", "-")
     datasheet_name = input(f'datasheet name ({default_datasheet_name}): ')
     datasheet_name = datasheet_name if datasheet_name else default_datasheet_name
-    datasheet_name = f'datasheets/{datasheet_name}.json'
+    datasheet_name = store.file(datasheet_name)
 
     with open(datasheet_name, 'w') as file:
         json.dump(reference_data, file, indent=2)
@@ -93,46 +135,418 @@ def update_kinematics(args):
         json.dump(data, file, indent=2)
 
 
+def bike_trajectory(bike, key, stats=None, steps=100):
+    """
+    The solved sweep of bike from the curve cache, solving and recording it
+    in steps first if it isn't there (collecting SolveStats in stats). Leaves
+    the bike at rest either way.
+    """
+
+    path = CurveCache().trajectory_file(key, steps)
+
+    try:
+        trajectory = Trajectory(path)
+    except (AssertionError, OSError, ValueError):
+        trajectory = Trajectory.record(bike, path, steps, stats=stats)
+    else:
+        # mark it recently used, as CurveCache.get does its entries
+        os.utime(path)
+
+    bike.platform.set_pose(trajectory.pose(0))
+    return trajectory
+
+
+def export_kinematics(datasheet_file, out_dir, extension):
+    """
+    Render the sweep of one datasheet to out_dir without a display, see
+    sim.export. Returns (datasheet_file, seconds, path or error, failed)
+    """
+
+    start = time.perf_counter()
+
+    try:
+        data = store.read(datasheet_file)
+        bike = Bike.from_datasheet(data)
+        trajectory = bike_trajectory(bike, curve_key(data))
+        name = os.path.splitext(os.path.basename(datasheet_file))[0]
+        path = os.path.join(out_dir, f'{name}.{extension}')
+
+        try:
+            export(bike, path, trajectory)
+        finally:
+            trajectory.close()
+
+        result, failed = path, False
+    except Exception as e:
+        result, failed = f'{type(e).__name__}: {e}', True
+
+    return datasheet_file, time.perf_counter() - start, result, failed
+
+
 def check_kinematics(args):
-    assert len(args) == 1, 'Supply a datasheet file'
-    datasheet = args[0]
-    bike = Bike.from_datasheet(datasheet)
-    draw(bike)
+    datasheets, jobs, options = batch_args(args)
 
+    # one datasheet and nothing else asked for, have a look at it
+    if len(datasheets) == 1 and jobs == 1 and not options:
+        datasheet = datasheets[0]
 
-def update_leverage_curve(args):
-    assert len(args) == 1, 'Supply a datasheet file'
-    datasheet_file = args[0]
-    bike = Bike.from_datasheet(datasheet_file)
-    leverage_data = quantized_leverage_curve(bike, resolution=6, normalized=True)
+        data = store.read(datasheet)
+        bike = Bike.from_datasheet(data)
+        trajectory = bike_trajectory(bike, curve_key(data))
 
-    with open(datasheet_file) as file:
-        data = json.loads(file.read())
+        try:
+            draw(bike, trajectory)
+        finally:
+            trajectory.close()
 
-    data['curve'] = leverage_data[1]
+        return
 
-    with open(args[0], 'w') as file:
+    out_dir = options.get('out', 'kinematics_review')
+    extension = options.get('format', 'gif')
+    os.makedirs(out_dir, exist_ok=True)
+
+    work = functools.partial(export_kinematics, out_dir=out_dir, extension=extension)
+    run_batch(work, datasheets, jobs)
+
+
+CHECKPOINT = '.update_lev.checkpoint'
+
+# curves kept in the cache for every bike, datasheets get the 6 point one
+CACHED_RESOLUTIONS = (6, 11, 21, 101)
+
+
+def write_datasheet(datasheet_file, data):
+    """
+    Write a datasheet as they are laid out in the repo, see atomic_write
+    """
+
+    with timing.phase('datasheet write'), atomic_write(datasheet_file) as file:
         json.dump(data, file, indent=2)
+        file.write('\n')
+
+
+def solve_leverage_curve(datasheet_file):
+    """
+    Solve the curve of one datasheet, or take it from the curve cache, and
+    write it back if it changed. Returns (datasheet_file, seconds, summary or
+    error, failed), never raising so that one bad datasheet can't take a
+    whole batch down with it
+    """
+
+    start = time.perf_counter()
+
+    try:
+        data = store.read(datasheet_file)
+        key = curve_key(data)
+        cache = CurveCache()
+        cached = cache.get(key)
+
+        if cached:
+            result = 'cached'
+        else:
+            bike = Bike.from_datasheet(data)
+            stats = SweepStats()
+
+            steps = data.get('solver', {}).get('steps', 100)
+            trajectory = bike_trajectory(bike, key, stats, steps)
+
+            raw = leverage_curve(bike, trajectory=trajectory)
+
+            trajectory.close()
+
+            curves = {
+                resolution: quantize(
+                    *raw,
+                    bike.travel,
+                    bike.stroke,
+                    resolution=resolution,
+                    normalized=True,
+                )[1]
+                for resolution in CACHED_RESOLUTIONS
+            }
+            cache.put(key, raw, curves)
+            cached = cache.get(key)
+            result = f'solved with {bike.platform.engine}: {stats}'
+
+        curve = cached['curves']['6']
+
+        if curves_differ(data.get('curve'), curve):
+            data['curve'] = curve
+            write_datasheet(datasheet_file, data)
+        else:
+            result += ', unchanged'
+
+        failed = False
+    except Exception as e:
+        result = f'{type(e).__name__}: {e}'
+        failed = True
+
+    return datasheet_file, time.perf_counter() - start, result, failed
+
+
+def batch_args(args, default=None):
+    """
+    Datasheets (files, globs or --all), -j N jobs and any --name=value
+    options out of the args of a batch command. Without datasheets, the
+    default ones if there are any.
+    """
+
+    jobs = 1
+    datasheets = []
+    options = {}
+
+    while args:
+        arg, args = args[0], args[1:]
+
+        if arg == '--all':
+            datasheets += kinematics_datasheets([])
+        elif arg == '-j':
+            jobs, args = int(args[0]), args[1:]
+        elif arg.startswith('-j'):
+            jobs = int(arg[2:])
+        elif arg.startswith('--') and '=' in arg:
+            name, value = arg[2:].split('=', 1)
+            options[name] = value
+        else:
+            datasheets += sorted(glob.glob(arg)) or [arg]
+
+    datasheets = datasheets or default
+    assert datasheets, 'Supply datasheet files, globs or --all'
+
+    return datasheets, jobs, options
+
+
+def run_batch(work, datasheets, jobs, checkpoint=None):
+    """
+    Run work (which returns (datasheet_file, seconds, summary, failed)) on
+    every datasheet over jobs processes, reporting progress and then a
+    summary. With a checkpoint file, datasheets done by an interrupted run
+    of the same batch are skipped. Returns the results that failed.
+    """
+
+    # pick up where an interrupted run of the same batch left off
+    done = []
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as file:
+            progress = json.loads(file.read())
+
+        if progress['datasheets'] == datasheets:
+            done = progress['done']
+            print(f'resuming, {len(done)} of {len(datasheets)} already done')
+
+    todo = [d for d in datasheets if d not in done]
+    results = []
+
+    def finished(result):
+        results.append(result)
+        datasheet_file, seconds, summary, failed = result
+        status = 'FAILED' if failed else 'ok'
+        print(f'[{len(results)}/{len(todo)}] {datasheet_file} {status} ({seconds:.1f}s)')
+
+        if checkpoint and not failed:
+            done.append(datasheet_file)
+            write_datasheet(checkpoint, {'datasheets': datasheets, 'done': done})
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(work, d) for d in todo]
+
+            for future in as_completed(futures):
+                finished(future.result())
+    else:
+        for datasheet_file in todo:
+            finished(work(datasheet_file))
+
+    print()
+    for datasheet_file, seconds, summary, failed in sorted(results):
+        print(f'{datasheet_file:<50} {seconds:>6.1f}s  {summary}')
+
+    failures = [result for result in results if result[3]]
+    print(f'\n{len(results) - len(failures)} done, {len(failures)} failed')
+
+    # only a batch that got through everything is done with its checkpoint
+    if checkpoint and not failures and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    return failures
+
+
+def update_leverage_curve(args):
+    datasheets, jobs, _options = batch_args(args)
+    run_batch(solve_leverage_curve, datasheets, jobs, checkpoint=CHECKPOINT)
+
+
+def check_uncertainty(args):
+    datasheets, _jobs, options = batch_args(args)
+    samples = int(options.get('samples', 1000))
+    sigma = float(options.get('sigma', 2))
+
+    for datasheet in datasheets:
+        bike = Bike.from_datasheet(store.read(datasheet))
+        quantized, _curve, failed = leverage_uncertainty(
+            bike,
+            samples=samples,
+            sigma=sigma,
+        )
+
+        print(f'{datasheet} ({samples} samples, sigma {sigma}, {failed} unsolvable)')
+        print(f'{"travel":>8} {"low":>8} {"mean":>8} {"high":>8}')
+
+        for x, low, mean, high in zip(quantized.x, quantized.low, quantized.mean, quantized.high):
+            print(f'{x:>8.1f} {low:>8.3f} {mean:>8.3f} {high:>8.3f}')
+
+
+def check_shocks(args):
+    assert len(args) >= 2, 'Supply a datasheet file and shock sizes, eg 205x60'
+    datasheet, sizes = args[0], args[1:]
+    shocks = [tuple(float(n) for n in size.split('x')) for size in sizes]
+
+    bike = Bike.from_datasheet(store.read(datasheet))
+
+    curves = shock_leverage_curves(bike, shocks)
+
+    for (e2e, stroke), (x_data, y_data) in curves.items():
+        travel = x_data[-1]
+        curve = quantize(x_data, y_data, travel, stroke, normalized=True)[1]
+        print(f'{e2e:g}x{stroke:g}: {travel:.1f}mm travel, curve {", ".join(f"{y:.3f}" for y in curve)}')
+
+
+def tune_datasheet(datasheet_file, max_error):
+    """
+    Store the cheapest solver settings that keep the curve of a datasheet
+    within max_error, see sim.tune_solver. Returns (datasheet_file, seconds,
+    settings or error, failed)
+    """
+
+    start = time.perf_counter()
+
+    try:
+        data = store.read(datasheet_file)
+        pick, _trials = tune_solver(
+            lambda: Bike.from_datasheet(data),
+            max_error=max_error,
+        )
+
+        assert pick is not None, f'nothing within {max_error}'
+        steps, tolerance, iterations, _seconds, error = pick
+
+        # no tolerance for the dyads engine, it doesn't take one
+        data['solver'] = {'steps': steps}
+        settings = f'{steps} steps'
+
+        if tolerance is not None:
+            data['solver']['tolerance'] = tolerance
+            settings += f', tolerance {tolerance:g}'
+
+        write_datasheet(datasheet_file, data)
+
+        result = f'{settings} ({iterations} iterations, error {error:.2g})'
+        failed = False
+    except Exception as e:
+        result = f'{type(e).__name__}: {e}'
+        failed = True
+
+    return datasheet_file, time.perf_counter() - start, result, failed
+
+
+def tune(args):
+    datasheets, jobs, options = batch_args(args)
+    max_error = float(options.get('error', 0.005))
+    work = functools.partial(tune_datasheet, max_error=max_error)
+    run_batch(work, datasheets, jobs)
+
+
+@functools.lru_cache(maxsize=None)
+def datasheet_schema():
+    """
+    The compiled reference datasheet, once per process
+    """
+
+    return schema.compile_schema(store.get('reference'))
+
+
+def validate_datasheet(datasheet_file):
+    """
+    Check one datasheet, see schema.validate. Returns (datasheet_file,
+    seconds, problems, failed)
+    """
+
+    start = time.perf_counter()
+
+    try:
+        problems = schema.validate(datasheet_schema(), store.read(datasheet_file))
+        result, failed = '; '.join(problems) or 'ok', bool(problems)
+    except Exception as e:
+        result, failed = f'{type(e).__name__}: {e}', True
+
+    return datasheet_file, time.perf_counter() - start, result, failed
+
+
+def validate(args):
+    every = [store.file(id) for id in store.ids()]
+    datasheets, jobs, _options = batch_args(args, default=every)
+
+    # compiled before the workers fork, so they don't each do it
+    datasheet_schema()
+
+    if run_batch(validate_datasheet, datasheets, jobs):
+        sys.exit(1)
+
+
+def check_iterations(args):
+    engine = 'relax'
+
+    if args and args[0].startswith('--engine='):
+        engine = args[0].split('=', 1)[1]
+        args = args[1:]
+
+    print(f'{"datasheet":<50} {"plain":>8} {"predicted":>10} {"saved":>6}')
+
+    for datasheet in kinematics_datasheets(args):
+        totals = []
+
+        for continuation in (False, True):
+            bike = Bike.from_datasheet(store.read(datasheet), engine=engine)
+            stats = SweepStats()
+
+            leverage_curve(bike, continuation=continuation, stats=stats)
+
+            totals.append(sum(stats.iterations))
+
+        saved = 1 - totals[1] / totals[0] if totals[0] else 0
+        print(f'{datasheet:<50} {totals[0]:>8} {totals[1]:>10} {saved:>6.0%}')
 
 
 if __name__ == '__main__':
     valid_commands = {
         'add_bike': (add_bike, 'add a new datasheet file for a bike'),
         'update_kin': (update_kinematics, 'update kinematics for an existing bike'),
-        'check_kin': (check_kinematics, 'visualize kinematics to check correctness'),
-        'update_lev': (update_leverage_curve, 'update curve based on existing kinematics'),
+        'check_kin': (check_kinematics, 'visualize kinematics to check correctness (or --format=gif|mp4|png|svg --out=DIR to render files, globs or --all, -j N)'),
+        'update_lev': (update_leverage_curve, 'update curves based on existing kinematics (files, globs or --all, -j N)'),
+        'check_unc': (check_uncertainty, 'confidence band of the curve with joints off by --sigma=px, over --samples=N'),
+        'check_shocks': (check_shocks, 'curves of a datasheet with other shock sizes (eye to eye x stroke, eg 205x60)'),
+        'tune': (tune, 'store the cheapest solver settings within --error=0.005 of a precise curve (files, globs or --all, -j N)'),
+        'check_iter': (check_iterations, 'compare solver iterations with and without pose prediction'),
+        'validate': (validate, 'check datasheets against datasheets/reference.json, every one if none are given (files, globs, -j N)'),
     }
 
     def show_commands(_args):
         print('Available commands are:')
         [print(f'  {c} - {valid_commands[c][1]}') for c in valid_commands.keys()]
+        print('Any command takes -v/-vv for more logging, and --profile[=path]')
+        print('to write cProfile stats and time each phase (use -j 1)')
 
     valid_commands['help'] = (show_commands, 'display available commands')
 
-    assert len(sys.argv) >= 2, 'Command missing, run help command for options'
-    command, args = sys.argv[1], sys.argv[2:]
+    argv, profile = timing.configure(sys.argv[1:])
+
+    assert len(argv) >= 1, 'Command missing, run help command for options'
+    command, args = argv[0], argv[1:]
 
     assert command in valid_commands.keys(), \
         'Invalid command, run help command for options'
 
-    valid_commands[command][0](args)
+    if profile is None:
+        valid_commands[command][0](args)
+    else:
+        timing.profile(valid_commands[command][0], profile or f'{command}.prof', args)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 """
-Transforms and inlines bike data from the bikes.csv file into the html file.
+Transforms bike data from the datasheets into a json asset for the html files.
 
 The bike data is transformed into data structures for quick searching out of
 the box without any client side indexing required. This is done by making an
@@ -11,6 +11,8 @@ term matching.
 
 Also move the rest of src files to dist... but those are as is with no
 transformation done to them.
+
+    ./build.py [-v] [--profile[=build.prof]]
 """
 
 import csv
@@ -19,52 +21,75 @@ import json
 import os
 import re
 import shutil
+import sys
+import unittest
+
+import timing
+
+from cache import CurveCache, curve_key
+from store import DatasheetStore
 
 
-class TrieNode:
-    def __init__(self, character):
-        self.character = character
-        self.object_ids = []
-        self.children_nodes = []
+class RadixNode:
+    def __init__(self, edge):
+        # the characters on the way here from the parent node
+        self.edge = edge
+        self.object_ids = set()
+        # by the first character of their edge, which is never shared
+        self.children = {}
 
     def add(self, string, object_id):
-        if len(string) == 0:
-            if object_id not in self.object_ids:
-                self.object_ids.append(object_id)
+        node = self
+
+        while string:
+            child = node.children.get(string[0])
+
+            if child is None:
+                child = RadixNode(string)
+                node.children[string[0]] = child
+                node = child
+                break
+
+            common = len(os.path.commonprefix([child.edge, string]))
 
-            return
+            # string leaves the edge part way, split it there
+            if common < len(child.edge):
+                middle = RadixNode(child.edge[:common])
+                child.edge = child.edge[common:]
+                middle.children[child.edge[0]] = child
+                node.children[string[0]] = middle
+                child = middle
 
-        added = False
+            node, string = child, string[common:]
 
-        for node in self.children_nodes:
-            if node.character == string[0]:
-                node.add(string[1:], object_id)
-                added = True
+        node.object_ids.add(object_id)
 
-        if not added:
-            node = TrieNode(string[0])
-            node.add(string[1:], object_id)
-            self.children_nodes.append(node)
+    def serialize(self):
+        """
+        [edge, object_ids] with a third item for the children, by the first
+        character of their edge, if there are any
+        """
 
-    def __dict__(self):
-        return {
-            'object_ids': self.object_ids,
-            'children': {
-                child.character: child.__dict__()
-                for child in self.children_nodes
-            }
-        }
+        node = [self.edge, sorted(self.object_ids)]
 
+        if self.children:
+            node.append({
+                character: self.children[character].serialize()
+                for character in sorted(self.children)
+            })
 
-class Trie:
+        return node
+
+
+class RadixTree:
     def __init__(self):
-        self.root = TrieNode(None)
+        self.root = RadixNode('')
 
     def add(self, term, object_id):
         self.root.add(term, object_id)
 
-    def __dict__(self):
-        return self.root.__dict__()
+    def serialize(self):
+        return self.root.serialize()
 
 
 # Importantly, these are in ascending order. This matters because we
@@ -157,106 +182,116 @@ fields = {
     'curve',
 }
 
-bikes = []
+@timing.phase('datasheet load')
+def load_bikes():
+    bikes = []
+    curve_cache = CurveCache()
+    store = DatasheetStore()
 
-with os.scandir('datasheets') as items:
-    for item in items:
-        if not item.is_file():
-            continue
+    for id in store.ids():
+        # may want to trim the data a bit here if we get a lot of bikes,
+        # all the kinematic data is unnecessary
+        full_data = store.get(id)
+        full_data['id'] = id
 
-        if not item.name.endswith('.json'):
-            continue
+        # a curve solved from the current kinematics by the current
+        # solver beats whatever was last written to the datasheet
+        if full_data.get('kinematics') is not None:
+            cached = curve_cache.get(curve_key(full_data))
 
-        if item.name == 'reference.json':
-            continue
+            if cached:
+                full_data['curve'] = cached['curves']['6']
 
-        with open(item.path, 'r') as datasheet_file:
-            # may want to trim the data a bit here if we get a lot of bikes,
-            # all the kinematic data is unnecessary
-            full_data = json.loads(datasheet_file.read())
-            full_data['id'] = item.name.split('.')[:-1][0]
-            bikes.append(full_data)
-
-output_object = {
-    # bikes can be an array with constant time lookup because the "ids" we
-    # store in our search structures are just the indexes of the bikes
-    'bikes': [],
-    'terms': {},
-    'terms_trie': None,
-    'ids': {},
-}
+        bikes.append(full_data)
 
-terms_trie = Trie()
+    store.save()
 
-for i, raw_bike_data in enumerate(bikes):
-    bike_data = {field: raw_bike_data.get(field) for field in fields}
-    output_object['bikes'].append(bike_data)
-    output_object['ids'][raw_bike_data['id']] = i
+    return bikes
 
-    searchable_terms = [str(f).lower() for f in [
-        bike_data['make'],
-        bike_data['model'],
-        bike_data['year_start'],
-        bike_data['year_end'],
-        # we'll add sizes separately cause we have to provide alternate
-        # spellings and interpolate anyway
-    ]]
 
-    # interpolate between years if they are different
-    if bike_data['year_start'] != bike_data['year_end']:
-        start, end = int(bike_data['year_start']), int(bike_data['year_end'])
+@timing.phase('index build')
+def build_index(bikes):
+    output_object = {
+        # bikes can be an array with constant time lookup because the "ids" we
+        # store in our search structures are just the indexes of the bikes
+        'bikes': [],
+        'terms': {},
+        'terms_trie': None,
+        'ids': {},
+    }
 
-        for year in range(start + 1, end):
-            searchable_terms.append(str(year))
+    terms_trie = RadixTree()
 
-    # expand size abreviation to alternative name, interpolate between them
+    for i, raw_bike_data in enumerate(bikes):
+        bike_data = {field: raw_bike_data.get(field) for field in fields}
+        output_object['bikes'].append(bike_data)
+        output_object['ids'][raw_bike_data['id']] = i
 
-    # BUG: for bikes with size ranges like XS-LG someone could search
-    #      "extra large" and this would match since we break on space and that
-    #      matches both "extra" and "large". This is really a generic bug with
-    #      how I'm matching all terms, but its particularly apparent here
+        searchable_terms = [str(f).lower() for f in [
+            bike_data['make'],
+            bike_data['model'],
+            bike_data['year_start'],
+            bike_data['year_end'],
+            # we'll add sizes separately cause we have to provide alternate
+            # spellings and interpolate anyway
+        ]]
 
-    size_map = get_size_map(bike_data['size_start'])
+        # interpolate between years if they are different
+        if bike_data['year_start'] != bike_data['year_end']:
+            start, end = int(bike_data['year_start']), int(bike_data['year_end'])
 
-    bounds = [
-        size_i for size_i in range(len(size_map)) if size_map[size_i][0] in
-        [bike_data['size_start'], bike_data['size_end']]
-    ]
+            for year in range(start + 1, end):
+                searchable_terms.append(str(year))
 
-    if len(bounds) == 1:
-        searchable_terms.append(size_map[bounds[0]][0].lower())
-        searchable_terms.append(size_map[bounds[0]][1].lower())
-    elif len(bounds) > 1:
-        for b in range(bounds[0], bounds[1] + 1):
-            searchable_terms.append(size_map[b][0].lower())
-            searchable_terms.append(size_map[b][1].lower())
-    else:
-        raise Exception('Unable to find size in sizes map ' +
-                        f'start={bike_data["size_start"]} ' +
-                        f'end={bike_data["size_end"]}')
-
-    # seems dumb to join then split, but some of these fields may be multiple
-    # terms themselves and this is just an easy way to do it
-    for term in ' '.join(searchable_terms).split(' '):
-        if output_object['terms'].get(term, None) is None:
-            output_object['terms'][term] = []
-
-        # dedupe, could use a set by then we'd have to convert back to list
-        # at some point and ordering would no longer be preserved... this is
-        # the lesser evil
-        if len(output_object['terms'][term]) and \
-                output_object['terms'][term][-1] == i:
-            continue
+        # expand size abreviation to alternative name, interpolate between them
+
+        # BUG: for bikes with size ranges like XS-LG someone could search
+        #      "extra large" and this would match since we break on space and that
+        #      matches both "extra" and "large". This is really a generic bug with
+        #      how I'm matching all terms, but its particularly apparent here
+
+        size_map = get_size_map(bike_data['size_start'])
+
+        bounds = [
+            size_i for size_i in range(len(size_map)) if size_map[size_i][0] in
+            [bike_data['size_start'], bike_data['size_end']]
+        ]
+
+        if len(bounds) == 1:
+            searchable_terms.append(size_map[bounds[0]][0].lower())
+            searchable_terms.append(size_map[bounds[0]][1].lower())
+        elif len(bounds) > 1:
+            for b in range(bounds[0], bounds[1] + 1):
+                searchable_terms.append(size_map[b][0].lower())
+                searchable_terms.append(size_map[b][1].lower())
+        else:
+            raise Exception('Unable to find size in sizes map ' +
+                            f'start={bike_data["size_start"]} ' +
+                            f'end={bike_data["size_end"]}')
 
-        output_object['terms'][term].append(i)
+        # seems dumb to join then split, but some of these fields may be multiple
+        # terms themselves and this is just an easy way to do it
+        for term in ' '.join(searchable_terms).split(' '):
+            if output_object['terms'].get(term, None) is None:
+                output_object['terms'][term] = []
 
-        # IDEA: if we wanted to add some common misspellings we could add
-        #       support for this just in our terms trie, without bothering to
-        #       create more indexes in the inverted index
-        terms_trie.add(term, i)
+            # dedupe, could use a set by then we'd have to convert back to list
+            # at some point and ordering would no longer be preserved... this is
+            # the lesser evil
+            if len(output_object['terms'][term]) and \
+                    output_object['terms'][term][-1] == i:
+                continue
 
+            output_object['terms'][term].append(i)
 
-output_object['terms_trie'] = terms_trie.__dict__()
+            # IDEA: if we wanted to add some common misspellings we could add
+            #       support for this just in our terms trie, without bothering to
+            #       create more indexes in the inverted index
+            terms_trie.add(term, i)
+
+    output_object['terms_trie'] = terms_trie.serialize()
+
+    return output_object
 
 
 # To build the site we take the src files, put their contents into a map, and
@@ -266,12 +301,12 @@ output_object['terms_trie'] = terms_trie.__dict__()
 # Transformations are:
 #
 # 1. Insert html partials into root html pages
-# 2. Insert data into root html pages
+# 2. Add the data as an asset of its own
 # 3. Generate assets checksums
 # 4. Swap asset references with new filenames (which include checksums)
 
 
-def bike_toc():
+def bike_toc(bikes):
     bike_list = []
 
     for letter in 'abcdefghijklmnopqrstuvwxyz':
@@ -304,94 +339,140 @@ def bike_toc():
     return ['<div class="bike-toc">'] + bike_list + ['</div>']
 
 
-built_files = {}
-partial_files = {}
-python_code = {
-    'bike-table-of-contents': bike_toc,
-}
-
 html_pattern = re.compile('.+.html$')
-asset_pattern = re.compile('.+.(css|js)$')
+asset_pattern = re.compile('.+.(css|js|json)$')
+
+
+@timing.phase('template render')
+def render(bikes, output_object):
+    """
+    The contents of every file going to dist, by name
+    """
+
+    built_files = {}
+    partial_files = {}
+    python_code = {
+        'bike-table-of-contents': lambda: bike_toc(bikes),
+    }
+
+    for filename in os.listdir('src'):
+        if not html_pattern.match(filename):
+            continue
 
-for filename in os.listdir('src'):
-    if not html_pattern.match(filename):
-        continue
+        with open(f'src/{filename}', 'r') as file:
+            built_files[filename] = file.read()
 
-    with open(f'src/{filename}', 'r') as file:
-        built_files[filename] = file.read()
+    for filename in os.listdir('src/partials'):
+        if not html_pattern.match(filename):
+            continue
+
+        with open(f'src/partials/{filename}', 'r') as file:
+            partial_files[filename] = file.read()
 
-for filename in os.listdir('src/partials'):
-    if not html_pattern.match(filename):
-        continue
+    for filename in os.listdir('src/assets'):
+        if not asset_pattern.match(filename):
+            continue
 
-    with open(f'src/partials/{filename}', 'r') as file:
-        partial_files[filename] = file.read()
+        with open(f'src/assets/{filename}', 'r') as file:
+            built_files[f'assets/{filename}'] = file.read()
 
-for filename in os.listdir('src/assets'):
-    if not asset_pattern.match(filename):
-        continue
+    for name in built_files.keys():
+        if not html_pattern.match(name):
+            continue
 
-    with open(f'src/assets/{filename}', 'r') as file:
-        built_files[f'assets/{filename}'] = file.read()
+        for python_name, python_output in python_code.items():
+            built_files[name] = built_files[name].replace(
+                f'<!-- python:{python_name} -->',
+                ''.join(python_output()),
+            )
 
-for name in built_files.keys():
-    if not html_pattern.match(name):
-        continue
+    for name in built_files.keys():
+        if not html_pattern.match(name):
+            continue
 
-    for python_name, python_output in python_code.items():
-        built_files[name] = built_files[name].replace(
-            f'<!-- python:{python_name} -->',
-            ''.join(python_output()),
-        )
+        for partial_name, partial_contents in partial_files.items():
+            built_files[name] = built_files[name].replace(
+                f'<!-- {partial_name} -->',
+                partial_contents
+            )
 
-for name in built_files.keys():
-    if not html_pattern.match(name):
-        continue
+    # fetched by the pages rather than inlined in them, so browsers can cache
+    # it like the rest of the assets
+    built_files['assets/bikes.json'] = json.dumps(output_object, separators=(',', ':'))
 
-    for partial_name, partial_contents in partial_files.items():
-        built_files[name] = built_files[name].replace(
-            f'<!-- {partial_name} -->',
-            partial_contents
-        )
+    for name, contents in list(built_files.items()):
+        if not asset_pattern.match(name):
+            continue
 
-for name, contents in built_files.items():
-    if not html_pattern.match(name):
-        continue
+        parts = name.split('.')
+        checksum = hashlib.md5(bytes(contents, 'utf-8')).hexdigest()
+        new_name = f'{".".join(parts[0:-1])}.{checksum}.{parts[-1]}'
 
-    bikes_variable = f'const bikesData = {json.dumps(output_object)};'
-    built_files[name] = contents.replace('// BIKE_DATA', bikes_variable)
+        built_files[new_name] = contents
+        del built_files[name]
 
-for name, contents in list(built_files.items()):
-    if not asset_pattern.match(name):
-        continue
+        for html_name, html_contents in built_files.items():
+            if not html_pattern.match(html_name):
+                continue
 
-    parts = name.split('.')
-    checksum = hashlib.md5(bytes(contents, 'utf-8')).hexdigest()
-    new_name = f'{".".join(parts[0:-1])}.{checksum}.{parts[-1]}'
+            html_contents = html_contents.replace(f'src="{name}"', f'src="{new_name}"')
+            built_files[html_name] = html_contents.replace(f'href="{name}"', f'href="{new_name}"')
 
-    built_files[new_name] = contents
-    del built_files[name]
+    return built_files
 
-    for html_name, html_contents in built_files.items():
-        if not html_pattern.match(html_name):
+
+@timing.phase('dist write')
+def write_dist(built_files):
+    # Before writing to the dist/ dir, clean up everything that is there already
+
+    for filename in os.listdir('dist'):
+        if filename == '.keep':
             continue
 
-        html_contents = html_contents.replace(f'src="{name}"', f'src="{new_name}"')
-        built_files[html_name] = html_contents.replace(f'href="{name}"', f'href="{new_name}"')
+        try:
+            os.remove(f'dist/{filename}')
+        except OSError:
+            shutil.rmtree(f'dist/{filename}')
+
+    for name, content in built_files.items():
+        os.makedirs(os.path.dirname(f'dist/{name}'), exist_ok=True)
+
+        with open(f'dist/{name}', 'x') as file:
+            file.write(content)
+
+
+def build():
+    bikes = load_bikes()
+    output_object = build_index(bikes)
+    write_dist(render(bikes, output_object))
+
+
+def main(args):
+    _args, profile = timing.configure(args)
+
+    if profile is None:
+        build()
+    else:
+        timing.profile(build, profile or 'build.prof')
+
 
-# Before writing to the dist/ dir, clean up everything that is there already
+class RadixTreeTest(unittest.TestCase):
+    def test_add(self):
+        tree = RadixTree()
 
-for filename in os.listdir('dist'):
-    if filename == '.keep':
-        continue
+        for i, term in enumerate(['status', 'stumpjumper', 'sb140', 'st', 'sb140']):
+            tree.add(term, i)
 
-    try:
-        os.remove(f'dist/{filename}')
-    except OSError:
-        shutil.rmtree(f'dist/{filename}')
+        self.assertEqual(tree.serialize(), ['', [], {
+            's': ['s', [], {
+                'b': ['b140', [2, 4]],
+                't': ['t', [3], {
+                    'a': ['atus', [0]],
+                    'u': ['umpjumper', [1]],
+                }],
+            }],
+        }])
 
-for name, content in built_files.items():
-    os.makedirs(os.path.dirname(f'dist/{name}'), exist_ok=True)
 
-    with open(f'dist/{name}', 'x') as file:
-        file.write(content)
+if __name__ == '__main__':
+    main(sys.argv[1:])
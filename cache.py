@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+A local cache of solved leverage curves, so that bikes whose kinematics
+haven't changed aren't solved again.
+
+Entries are addressed by a hash of everything that goes into a curve: the
+kinematics, wheel_travel, stroke, eyetoeye and solver settings of the
+datasheet, plus the SOLVER_VERSION of sim.py. Each holds the raw curve from
+leverage_curve and the normalized curve quantized at a few resolutions, next
+to the solved trajectories of the sweep (see sim.Trajectory). The least
+recently used entries are evicted once the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import unittest
+
+from atomic import atomic_write
+from sim import SOLVER_VERSION
+
+
+CACHE_DIR = '.curve_cache'
+
+# datasheet fields a curve depends on
+CURVE_FIELDS = ['kinematics', 'wheel_travel', 'stroke', 'eyetoeye', 'solver']
+
+# stored curves closer than this to a new one are left alone
+CURVE_TOLERANCE = 1e-4
+
+
+def curve_key(data):
+    """
+    The cache key for the curve of a datasheet (as loaded from its json)
+    """
+
+    inputs = {field: data.get(field) for field in CURVE_FIELDS}
+    inputs['solver_version'] = SOLVER_VERSION
+    encoded = json.dumps(inputs, sort_keys=True).encode('utf-8')
+
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def curves_differ(a, b, tolerance=CURVE_TOLERANCE):
+    if a is None or b is None or len(a) != len(b):
+        return True
+
+    return any(abs(x - y) > tolerance for x, y in zip(a, b))
+
+
+class CurveCache:
+    def __init__(self, path=CACHE_DIR, max_bytes=16_000_000):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def file(self, key):
+        return os.path.join(self.path, f'{key}.json')
+
+    def trajectory_file(self, key, steps):
+        """
+        Where the sim.Trajectory of the sweep behind an entry, in steps, is
+        kept
+        """
+
+        os.makedirs(self.path, exist_ok=True)
+        return os.path.join(self.path, f'{key}.{steps}.traj')
+
+    def get(self, key):
+        """
+        {'raw': [x_data, y_data], 'curves': {resolution: y_data}} or None.
+        Resolutions are strings, as they come back from json.
+        """
+
+        try:
+            with open(self.file(key)) as file:
+                entry = json.loads(file.read())
+        except (OSError, ValueError):
+            return None
+
+        # mark it recently used
+        os.utime(self.file(key))
+
+        return entry
+
+    def put(self, key, raw, curves):
+        os.makedirs(self.path, exist_ok=True)
+        entry = {
+            'raw': [list(raw[0]), list(raw[1])],
+            'curves': {str(r): list(curve) for r, curve in curves.items()},
+        }
+
+        with atomic_write(self.file(key)) as file:
+            json.dump(entry, file)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Drop least recently used entries until the cache fits in max_bytes
+        """
+
+        entries = []
+
+        with os.scandir(self.path) as items:
+            for item in items:
+                if item.name.endswith(('.json', '.traj')):
+                    stat = item.stat()
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total -= size
+
+
+class CurveCacheTest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = CurveCache(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key(self):
+        data = {
+            'make': 'a',
+            'kinematics': {'joints': [], 'links': []},
+            'wheel_travel': 160,
+            'stroke': 65,
+            'eyetoeye': 230,
+        }
+
+        key = curve_key(data)
+        self.assertEqual(key, curve_key({**data, 'make': 'b', 'curve': [1]}))
+        self.assertNotEqual(key, curve_key({**data, 'stroke': 62.5}))
+
+    def test_key_solver_settings(self):
+        data = {'kinematics': {'joints': [], 'links': []}, 'stroke': 65}
+        tuned = {**data, 'solver': {'steps': 50}}
+
+        self.assertNotEqual(curve_key(data), curve_key(tuned))
+        self.assertNotEqual(curve_key(tuned), curve_key({**data, 'solver': {'steps': 200}}))
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get('a'))
+
+        self.cache.put('a', ([0, 1], [2, 3]), {6: [1, 2, 3, 4, 5, 6]})
+        self.assertEqual(self.cache.get('a'), {
+            'raw': [[0, 1], [2, 3]],
+            'curves': {'6': [1, 2, 3, 4, 5, 6]},
+        })
+
+    def test_evicts_least_recently_used(self):
+        for i, key in enumerate(['a', 'b', 'c']):
+            self.cache.put(key, ([0], [1]), {})
+            os.utime(self.cache.file(key), (i, i))
+
+        size = os.path.getsize(self.cache.file('a'))
+        self.cache.max_bytes = size * 2
+        self.cache.get('a')
+        self.cache.evict()
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_curves_differ(self):
+        self.assertFalse(curves_differ([1, 2], [1 + 1e-6, 2]))
+        self.assertTrue(curves_differ([1, 2], [1.01, 2]))
+        self.assertTrue(curves_differ([1, 2], [1, 2, 3]))
+        self.assertTrue(curves_differ(None, [1, 2]))
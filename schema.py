@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""
+Checks a datasheet against the structure of datasheets/reference.json before
+anything else trips over it, see bikes.py validate.
+
+The reference datasheet is compiled once into a tree of the fields a
+datasheet has, the types they take and whether they are required. Checking a
+datasheet walks that tree, and then whatever the structure can't say: sizes
+from one of the size maps of build.py, years in order, links between joints
+that exist, one axle and one shock.
+"""
+
+import unittest
+
+from build import get_size_map
+
+
+NUMBER = (int, float)
+
+# what reference.json, a template to be filled in, doesn't say by itself:
+# path (with '*' for the items of a list), types, required
+EXTRA_FIELDS = [
+    (('kinematics',), (dict,), False),
+    (('kinematics', 'reverse_x'), (bool,), False),
+    (('kinematics', 'imgalt'), (str,), False),
+    (('kinematics', 'joints', '*', 'x'), NUMBER, True),
+    (('kinematics', 'joints', '*', 'y'), NUMBER, True),
+    (('kinematics', 'links', '*', 'is_shock_shadow'), (bool,), False),
+    (('kinematics', 'links', '*', 'ignore'), (bool,), False),
+    (('curve', '*'), NUMBER, True),
+    (('solver',), (dict,), False),
+    (('solver', 'steps'), (int,), True),
+    (('solver', 'tolerance'), NUMBER, False),
+]
+
+
+def field(types, required=True):
+    return {'types': types, 'required': required, 'fields': {}, 'items': None}
+
+
+def compile_value(value, required=True):
+    if isinstance(value, bool):
+        return field((bool,), required)
+
+    if isinstance(value, NUMBER):
+        return field(NUMBER, required)
+
+    if isinstance(value, str):
+        return field((str,), required)
+
+    if isinstance(value, dict):
+        node = field((dict,), required)
+        node['fields'] = {k: compile_value(v) for k, v in value.items()}
+        return node
+
+    node = field((list,), required)
+
+    if value and all(isinstance(item, dict) for item in value):
+        # items of the reference lists show different optional fields, a
+        # field is required if every item has it
+        merged = {}
+
+        for item in value:
+            merged.update(item)
+
+        node['items'] = compile_value(merged)
+
+        for name, child in node['items']['fields'].items():
+            child['required'] = all(name in item for item in value)
+    elif value:
+        node['items'] = compile_value(value[0])
+
+    return node
+
+
+def compile_schema(reference):
+    """
+    The tree of fields of reference (a datasheet), with EXTRA_FIELDS added
+    """
+
+    schema = compile_value(reference)
+
+    for path, types, required in EXTRA_FIELDS:
+        node = schema
+
+        for name in path[:-1]:
+            node = node['items'] if name == '*' else node['fields'][name]
+
+        if path[-1] == '*':
+            node['items'] = field(types, required)
+        elif path[-1] in node['fields']:
+            node['fields'][path[-1]].update(types=types, required=required)
+        else:
+            node['fields'][path[-1]] = field(types, required)
+
+    return schema
+
+
+def check_fields(node, value, path, problems):
+    # bools are ints as far as isinstance goes, but never numbers here
+    if not isinstance(value, node['types']) or \
+            (isinstance(value, bool) and bool not in node['types']):
+        names = '/'.join(t.__name__ for t in node['types'])
+        problems.append(f'{path} should be {names}, not {type(value).__name__}')
+        return
+
+    if isinstance(value, dict):
+        for name, child in node['fields'].items():
+            if name in value:
+                check_fields(child, value[name], f'{path}.{name}', problems)
+            elif child['required']:
+                problems.append(f'{path}.{name} missing')
+
+        for name in value.keys() - node['fields'].keys():
+            problems.append(f'{path}.{name} unknown')
+
+    if isinstance(value, list) and node['items'] is not None:
+        for i, item in enumerate(value):
+            check_fields(node['items'], item, f'{path}[{i}]', problems)
+
+
+def check_sizes(data, problems):
+    try:
+        size_map = [size[0] for size in get_size_map(data['size_start'])]
+    except Exception:
+        problems.append(f'size_start {data["size_start"]} is in no size map')
+        return
+
+    if data['size_end'] not in size_map:
+        problems.append(f'size_end {data["size_end"]} is not in the size map of size_start')
+    elif size_map.index(data['size_end']) < size_map.index(data['size_start']):
+        problems.append('size_end is smaller than size_start')
+
+
+def check_kinematics(kinematics, problems):
+    joints = [joint['name'] for joint in kinematics['joints']]
+    links = [link['name'] for link in kinematics['links']]
+
+    for name in {n for n in joints if joints.count(n) > 1}:
+        problems.append(f'more than one joint named {name}')
+
+    for name in {n for n in links if links.count(n) > 1}:
+        problems.append(f'more than one link named {name}')
+
+    for link in kinematics['links']:
+        for end in ('j1', 'j2'):
+            if link[end] not in joints:
+                problems.append(f'link {link["name"]} {end} {link[end]} is not a joint')
+
+        if link['j1'] == link['j2']:
+            problems.append(f'link {link["name"]} j1 and j2 are the same')
+
+    axles = sum(1 for joint in kinematics['joints'] if joint.get('is_axle'))
+    shocks = sum(1 for link in kinematics['links'] if link.get('is_shock'))
+
+    if axles != 1:
+        problems.append(f'{axles} axles, should be one')
+
+    if shocks != 1:
+        problems.append(f'{shocks} shocks, should be one')
+
+
+def validate(schema, data):
+    """
+    Everything wrong with data (a datasheet) as a list of messages. The rest
+    of the checks need the structure to be right, so they only happen once
+    it is.
+    """
+
+    problems = []
+    check_fields(schema, data, 'datasheet', problems)
+
+    if problems:
+        return problems
+
+    for name in ('make', 'model'):
+        if not data[name].strip():
+            problems.append(f'{name} is empty')
+
+    for name in ('wheel_travel', 'stroke', 'eyetoeye'):
+        if data[name] <= 0:
+            problems.append(f'{name} should be positive')
+
+    if data['year_start'] > data['year_end']:
+        problems.append('year_start is after year_end')
+
+    check_sizes(data, problems)
+
+    if 'kinematics' in data:
+        check_kinematics(data['kinematics'], problems)
+
+    return problems
+
+
+class ValidateTest(unittest.TestCase):
+    def setUp(self):
+        import json
+
+        with open('datasheets/reference.json') as file:
+            self.schema = compile_schema(json.loads(file.read()))
+
+        with open('datasheets/pivot-firebird-2025.json') as file:
+            self.data = json.loads(file.read())
+
+    def test_valid(self):
+        self.assertEqual(validate(self.schema, self.data), [])
+
+        del self.data['kinematics']
+        self.assertEqual(validate(self.schema, self.data), [])
+
+    def test_structure(self):
+        self.data['stroke'] = '65'
+        self.data['year_start'] = True
+        self.data['kinematics']['joints'][0]['is_axel'] = True
+        del self.data['kinematics']['links'][0]['j2']
+
+        self.assertEqual(sorted(validate(self.schema, self.data)), [
+            'datasheet.kinematics.joints[0].is_axel unknown',
+            'datasheet.kinematics.links[0].j2 missing',
+            'datasheet.stroke should be int/float, not str',
+            'datasheet.year_start should be int/float, not bool',
+        ])
+
+    def test_consistency(self):
+        self.data['size_start'], self.data['size_end'] = 'XL', 'S2'
+        self.data['year_start'] = self.data['year_end'] + 1
+        self.data['kinematics']['links'][0]['j1'] = 'nowhere'
+
+        for link in self.data['kinematics']['links']:
+            link['is_shock'] = True
+
+        problems = validate(self.schema, self.data)
+        self.assertIn('size_end S2 is not in the size map of size_start', problems)
+        self.assertIn('year_start is after year_end', problems)
+        self.assertIn(f'{len(self.data["kinematics"]["links"])} shocks, should be one', problems)
+        self.assertTrue(any('nowhere is not a joint' in p for p in problems))
@@ -5,11 +5,29 @@
 A geometric constraint solver to find leverage curves from pictures of bikes.
 """
 
+import bisect
 import json
+import logging
 import math
+import mmap
+import os
+import struct
 import sys
+import time
 import unittest
 
+from array import array
+
+from atomic import atomic_write
+from timing import phase
+
+
+log = logging.getLogger('sim')
+
+# bump whenever a change to the solver or the curve processing changes the
+# curves it produces, it invalidates everything in the curve cache
+SOLVER_VERSION = 1
+
 
 # NOTE: random thoughts
 #       - need to be able to constrain joints on just x, y, and on some axis
@@ -19,12 +37,38 @@ import unittest
 class Joint:
     def __init__(self, x, y, name):
         self.name = name
-        self.x = x
-        self.y = y
-        self.constrained_coord = False
+        # coordinates live in arrays so that a compiled platform can hold
+        # every joint in one place, see Platform.compile
+        self._bind(array('d', [x]), array('d', [y]), array('b', [0]), 0)
+
+    def _bind(self, xs, ys, fixed, index):
+        self._xs = xs
+        self._ys = ys
+        self._fixed = fixed
+        self._index = index
+
+    @property
+    def x(self):
+        return self._xs[self._index]
+
+    @x.setter
+    def x(self, value):
+        self._xs[self._index] = value
+
+    @property
+    def y(self):
+        return self._ys[self._index]
+
+    @y.setter
+    def y(self, value):
+        self._ys[self._index] = value
+
+    @property
+    def constrained_coord(self):
+        return bool(self._fixed[self._index])
 
     def constrain_coord(self):
-        self.constrained_coord = True
+        self._fixed[self._index] = 1
 
     def __str__(self):
         if not self.constrained_coord:
@@ -42,7 +86,21 @@ class Linkage:
         self.name = name
         self.j1 = j1
         self.j2 = j2
-        self.constrained_length = None
+        # same idea as the joint coords, nan means unconstrained
+        self._bind(array('d', [math.nan]), 0)
+
+    def _bind(self, lengths, index):
+        self._lengths = lengths
+        self._index = index
+
+    @property
+    def constrained_length(self):
+        length = self._lengths[self._index]
+        return None if math.isnan(length) else length
+
+    @constrained_length.setter
+    def constrained_length(self, value):
+        self._lengths[self._index] = math.nan if value is None else value
 
     @property
     def current_length(self):
@@ -129,41 +187,220 @@ class Linkage:
 class Platform:
     """
     A platform is a system of constrained joints and linkages
+
+    There are three engines to solve it with. 'relax' adjusts one linkage at
+    a time and sweeps until everything settles. 'newton' solves all the
+    length constraints at once with damped Gauss-Newton (Levenberg-Marquardt)
+    steps, which converges quadratically instead of crawling there. 'dyads'
+    places the joints one at a time by circle intersections following the
+    plan (see plan), no iterating at all, and hands over to the fallback
+    engine for platforms that can't be broken down like that.
+
+    They all run against the compiled form of the platform (see compile)
+    rather than walking the Joint and Linkage objects.
+
+    tolerance is the total link error the iterative engines stop at, None
+    for each engine's own (0.00001 for relax, 1e-9 for newton).
     """
 
-    def __init__(self):
-        self.linkages = {}
+    engines = ('relax', 'newton', 'dyads')
 
+    def __init__(self, engine='relax', fallback='newton'):
+        assert engine in self.engines, f'unknown engine {engine}'
+        assert fallback in ('relax', 'newton'), 'fallback must be iterative'
+        self.linkages = {}
+        self.engine = engine
+        self.fallback = fallback
+        self.compiled = None
+        self.last_stats = None
+        self.tolerance = None
 
     def add_linkage(self, j1, j2, name):
         assert self.linkages.get(name, None) is None, 'duplicate linkage'
         linkage = Linkage(j1, j2, name)
         self.linkages[name] = linkage
+        self.compiled = None
         return linkage
 
-    def solve(self):
-        something_constrained = False
-        for link in self.linkages.values():
-            if link.constrained_length is not None:
-                something_constrained = True
+    def compile(self):
+        """
+        Lower the joints and linkages into flat arrays. The Joint and Linkage
+        objects are rebound as views over those arrays, so anything holding
+        on to them (Bike.joints, draw, leverage_curve...) sees the solved
+        positions without any copying back and forth.
+
+        Compiling happens on the first solve, and again after linkages are
+        added, so calling this directly is only needed to get at the arrays.
+        """
+
+        self.compiled = CompiledPlatform(self.linkages.values())
+        return self.compiled
+
+    def solve(self, engine=None, stats=False):
+        """
+        Move the joints until every constrained linkage is at its length, and
+        return how many iterations it took. With stats, return a SolveStats
+        of the solve instead.
+
+        If the platform can't be solved, the SolveStats of the attempt is
+        kept as last_stats (and summarised in the assertion) either way.
+        """
+
+        engine = engine or self.engine
+        assert engine in self.engines, f'unknown engine {engine}'
+
+        compiled = self.compiled or self.compile()
 
         # not much thought put in here... just constrain something please
-        assert something_constrained, 'must have at least 1 constrained link'
+        assert compiled.constrained, 'must have at least 1 constrained link'
 
-        error = self.error
-        count = 0
+        started = time.perf_counter()
+        residuals = [] if stats else None
+        # dyads are exact, or as far off as their fallback leaves them
+        tolerance = self.engine_tolerance(
+            self.fallback if engine == 'dyads' else engine
+        )
 
-        while error > 0.00001:
-            assert count < 1_000_000, 'unable to solve platform'
+        try:
+            count = self._solve(compiled, engine, residuals)
+        except AssertionError as error:
+            self.last_stats = SolveStats(
+                compiled,
+                engine,
+                None,
+                residuals or [],
+                time.perf_counter() - started,
+                tolerance,
+            )
+            raise AssertionError(f'{error} ({self.last_stats})') from error
+
+        if not stats:
+            return count
+
+        return SolveStats(
+            compiled,
+            engine,
+            count,
+            residuals,
+            time.perf_counter() - started,
+            tolerance,
+        )
 
-            for link in self.linkages.values():
-                link.adjust()
+    def engine_tolerance(self, engine):
+        if self.tolerance:
+            return self.tolerance
 
-            error = self.error
-            count += 1
+        return 1e-9 if engine == 'newton' else 0.00001
+
+    def _solve(self, compiled, engine, residuals):
+        if engine == 'dyads':
+            plan = self.plan()
+            count = compiled.solve_dyads(plan, residuals) \
+                if plan is not None \
+                else None
+
+            if count is not None:
+                return count
+
+            engine = self.fallback
+
+        if engine == 'newton':
+            return compiled.solve_newton(
+                self.rigid_bodies(),
+                residuals,
+                self.engine_tolerance(engine),
+            )
+
+        return compiled.solve_relax(residuals, self.engine_tolerance(engine))
+
+    def rigid_bodies(self):
+        """
+        Triangulated parts of the platform (and anything braced onto them)
+        that can only move as one piece, see CompiledPlatform.rigid_bodies.
+        The newton engine solves for each as a single body with 3 degrees of
+        freedom instead of fighting to keep its redundant links consistent.
+        """
+
+        compiled = self.compiled or self.compile()
+        constrained = tuple(compiled.constrained)
+
+        if constrained not in compiled.bodies:
+            compiled.bodies[constrained] = compiled.rigid_bodies(constrained)
+
+        return compiled.bodies[constrained]
+
+    def plan(self):
+        """
+        Break the platform down into a sequence of dyads: starting from the
+        fixed joints, repeatedly find a free joint constrained to two already
+        placed joints, which pins it to one of the two intersections of the
+        circles around them. Single pivots, four bars, horst links, short
+        link VPPs... all come apart this way.
+
+        Returns the steps as (joint, a, link to a, b, link to b) indexes into
+        the compiled arrays, or None when some joints can't be reached.
+        """
+
+        compiled = self.compiled or self.compile()
+        constrained = tuple(compiled.constrained)
+
+        if constrained not in compiled.plans:
+            compiled.plans[constrained] = compiled.plan(constrained)
+
+        return compiled.plans[constrained]
+
+    def pose(self):
+        """
+        A copy of every joint's coordinates, to hand back to extrapolate
+        """
+
+        compiled = self.compiled or self.compile()
+        return array('d', compiled.xs), array('d', compiled.ys)
+
+    def velocities(self, rates):
+        """
+        {joint: (dx, dy)} for every joint, per unit of length change of the
+        linkages in rates ({linkage: rate}), at the current (solved) pose.
+        See CompiledPlatform.velocities.
+        """
+
+        compiled = self.compiled or self.compile()
+        vx, vy = compiled.velocities({
+            compiled.linkages.index(link): rate for link, rate in rates.items()
+        })
+
+        return {
+            joint: (vx[i], vy[i]) for i, joint in enumerate(compiled.joints)
+        }
+
+    def set_pose(self, pose):
+        compiled = self.compiled or self.compile()
+        compiled.xs[:] = array('d', pose[0])
+        compiled.ys[:] = array('d', pose[1])
+
+    def extrapolate(self, previous, current, ratio):
+        """
+        Move the joints along the tangent through two poses, ratio being how
+        far past current to go in units of the previous -> current step. Used
+        as the predictor ahead of a solve, which then only has to correct the
+        (small) curvature the straight line misses.
+        """
+
+        compiled = self.compiled or self.compile()
+        xs, ys = compiled.xs, compiled.ys
+
+        for i in range(len(xs)):
+            if compiled.fixed[i]:
+                continue
+
+            xs[i] = current[0][i] + (current[0][i] - previous[0][i]) * ratio
+            ys[i] = current[1][i] + (current[1][i] - previous[1][i]) * ratio
 
     @property
     def error(self):
+        if self.compiled is not None:
+            return self.compiled.error()
+
         return sum([abs(link.error) for link in self.linkages.values()])
 
     def __str__(self):
@@ -176,6 +413,752 @@ class Platform:
         return ret
 
 
+class CompiledPlatform:
+    """
+    A platform lowered into a struct of arrays:
+
+    xs, ys   joint coordinates
+    fixed    1 where the joint has a constrained coord
+    j1, j2   joint indexes of each link
+    lengths  constrained length of each link (nan when unconstrained)
+
+    Error and adjustments are evaluated over all links in a single pass over
+    these arrays.
+    """
+
+    def __init__(self, linkages):
+        self.linkages = list(linkages)
+        self.joints = []
+        index = {}
+
+        for link in self.linkages:
+            for joint in (link.j1, link.j2):
+                if joint not in index:
+                    index[joint] = len(self.joints)
+                    self.joints.append(joint)
+
+        self.xs = array('d', [j.x for j in self.joints])
+        self.ys = array('d', [j.y for j in self.joints])
+        self.fixed = array('b', [j.constrained_coord for j in self.joints])
+        self.j1 = array('l', [index[l.j1] for l in self.linkages])
+        self.j2 = array('l', [index[l.j2] for l in self.linkages])
+        self.lengths = array('d', [
+            math.nan if l.constrained_length is None else l.constrained_length
+            for l in self.linkages
+        ])
+
+        for i, joint in enumerate(self.joints):
+            joint._bind(self.xs, self.ys, self.fixed, i)
+
+        for i, link in enumerate(self.linkages):
+            link._bind(self.lengths, i)
+
+        # dyad plans and rigid bodies by which links are constrained, see
+        # Platform.plan and Platform.rigid_bodies
+        self.plans = {}
+        self.bodies = {}
+
+    @property
+    def constrained(self):
+        return [k for k, length in enumerate(self.lengths) if length == length]
+
+    def error(self):
+        xs, ys, lengths = self.xs, self.ys, self.lengths
+        total = 0
+
+        for a, b, length in zip(self.j1, self.j2, lengths):
+            # nan != nan, so this skips unconstrained links
+            if length != length:
+                continue
+
+            dx = xs[b] - xs[a]
+            dy = ys[b] - ys[a]
+            total += abs(length - math.sqrt(dx * dx + dy * dy))
+
+        return total
+
+    def solve_relax(self, residuals=None, tolerance=0.00001):
+        """
+        Sweep Linkage.adjust over every link until the total error settles.
+
+        Rather than re-measuring every link after each sweep, the error of each
+        link is kept as we go, with a running total patched whenever one
+        changes. Adjusting a link measures it (the adjustment needs its length
+        anyway) and leaves it at its constrained length, so the only links
+        that need measuring again at the end of a sweep are the ones touching
+        a joint that a later link in the sweep moves. Checking for convergence
+        is then just reading the total.
+        """
+
+        xs, ys, fixed, lengths = self.xs, self.ys, self.fixed, self.lengths
+        j1, j2 = self.j1, self.j2
+        constrained = self.constrained
+        errors = array('d', [0.0] * len(lengths))
+
+        # only links that have something to adjust take part in a sweep
+        sweep = [
+            (k, j1[k], j2[k], not fixed[j1[k]], not fixed[j2[k]])
+            for k in constrained
+            if not fixed[j1[k]] or not fixed[j2[k]]
+        ]
+
+        stale = []
+        moved_later = set()
+        for k, a, b, free_a, free_b in reversed(sweep):
+            if a in moved_later or b in moved_later:
+                stale.append(k)
+            if free_a:
+                moved_later.add(a)
+            if free_b:
+                moved_later.add(b)
+
+        def measure(links):
+            change = 0
+
+            for k in links:
+                dx = xs[j2[k]] - xs[j1[k]]
+                dy = ys[j2[k]] - ys[j1[k]]
+                error = abs(lengths[k] - math.sqrt(dx * dx + dy * dy))
+                change += error - errors[k]
+                errors[k] = error
+
+            return change
+
+        total = measure(constrained)
+        count = 0
+
+        while True:
+            # the running total drifts by a few ulps (and adjusted links are
+            # only at their length to within rounding) so settle the last
+            # stretch against a fresh sum
+            if total <= tolerance * 2:
+                total = self.error()
+
+            if total <= tolerance:
+                break
+
+            assert count < 1_000_000, 'unable to solve platform'
+
+            for k, a, b, free_a, free_b in sweep:
+                rise = ys[b] - ys[a]
+                run = xs[b] - xs[a]
+                error = lengths[k] - math.sqrt(run * run + rise * rise)
+
+                total -= errors[k]
+                errors[k] = 0
+
+                if error == 0:
+                    continue
+
+                # pull the joints in or push them out along the linkage's angle
+                angle = math.atan(rise / run) if run != 0 else None
+                adjustment = error / (2 if free_a and free_b else 1)
+                sign = 1 if error < 0 else -1
+
+                dy = abs(adjustment * math.sin(angle)) * sign \
+                    if angle is not None \
+                    else adjustment * sign
+
+                dx = abs(adjustment * math.cos(angle)) * sign \
+                    if angle is not None \
+                    else 0
+
+                if run > 0:
+                    dx_a, dx_b = dx, -dx
+                else:
+                    dx_a, dx_b = -dx, dx
+
+                if rise > 0:
+                    dy_a, dy_b = dy, -dy
+                else:
+                    dy_a, dy_b = -dy, dy
+
+                if free_a:
+                    xs[a] += dx_a
+                    ys[a] += dy_a
+                if free_b:
+                    xs[b] += dx_b
+                    ys[b] += dy_b
+
+            total += measure(stale)
+            count += 1
+
+            if residuals is not None:
+                residuals.append(total)
+
+        return count
+
+    def plan(self, constrained):
+        neighbours = {}
+        for k in constrained:
+            a, b = self.j1[k], self.j2[k]
+            neighbours.setdefault(a, []).append((k, b))
+            neighbours.setdefault(b, []).append((k, a))
+
+        placed = {j for j in neighbours if self.fixed[j]}
+        unplaced = [j for j in neighbours if j not in placed]
+        steps = []
+
+        while unplaced:
+            for joint in unplaced:
+                anchors = {}
+                for k, other in neighbours[joint]:
+                    if other in placed and other not in anchors:
+                        anchors[other] = k
+
+                if len(anchors) >= 2:
+                    (a, ka), (b, kb) = list(anchors.items())[:2]
+                    steps.append((joint, a, ka, b, kb))
+                    placed.add(joint)
+                    unplaced.remove(joint)
+                    break
+            else:
+                # nothing left can be placed from what we have
+                return None
+
+        return steps
+
+    def solve_dyads(self, plan, residuals=None):
+        """
+        Place every joint following the plan, picking the circle intersection
+        on the same side of its two anchors as the joint was before, so the
+        mechanism doesn't flip between branches. Returns None, with the joints
+        left untouched, if the circles don't meet (or the leftover constraints
+        the plan didn't use aren't met) so the caller can fall back.
+        """
+
+        xs, ys, lengths = self.xs, self.ys, self.lengths
+        start = array('d', xs), array('d', ys)
+
+        for joint, a, ka, b, kb in plan:
+            # which side of a -> b the joint was on before we started
+            side = _side(
+                start[0][a], start[1][a],
+                start[0][b], start[1][b],
+                start[0][joint], start[1][joint],
+            )
+
+            point = _intersect(
+                xs[a], ys[a], lengths[ka],
+                xs[b], ys[b], lengths[kb],
+                side,
+            )
+
+            if point is None:
+                xs[:], ys[:] = start
+                return None
+
+            xs[joint], ys[joint] = point
+
+        error = self.error()
+
+        if residuals is not None:
+            residuals.append(error)
+
+        if error > 0.00001:
+            xs[:], ys[:] = start
+            return None
+
+        return 1
+
+    def solve_dyads_batch(self, plan, xs, ys, lengths, start):
+        """
+        solve_dyads for a whole batch of platforms of this shape at once, one
+        plan step at a time across all of them. xs[j], ys[j] and lengths[k]
+        hold joint j's coordinates and link k's length in every platform, and
+        start the (xs, ys) each picks its intersections' sides from. Returns
+        how many platforms couldn't be solved; their joints are set to nan.
+        """
+
+        count = len(xs[0])
+        sx, sy = start
+
+        for joint, a, ka, b, kb in plan:
+            jx, jy = xs[joint], ys[joint]
+            axs, ays, ras = xs[a], ys[a], lengths[ka]
+            bxs, bys, rbs = xs[b], ys[b], lengths[kb]
+            sides = [
+                _side(*coords) for coords in zip(
+                    sx[a], sy[a], sx[b], sy[b], sx[joint], sy[joint],
+                )
+            ]
+
+            for s in range(count):
+                point = _intersect(
+                    axs[s], ays[s], ras[s],
+                    bxs[s], bys[s], rbs[s],
+                    sides[s],
+                )
+                jx[s], jy[s] = point or (math.nan, math.nan)
+
+        # links the plan didn't need still have to hold their lengths
+        used = {k for _, _, ka, _, kb in plan for k in (ka, kb)}
+        failed = set()
+
+        for k in self.constrained:
+            if k in used:
+                continue
+
+            a, b = self.j1[k], self.j2[k]
+            for s in range(count):
+                dx, dy = xs[b][s] - xs[a][s], ys[b][s] - ys[a][s]
+                if not abs(math.sqrt(dx * dx + dy * dy) - lengths[k][s]) <= 0.00001:
+                    failed.add(s)
+
+        for s in range(count):
+            if any(x[s] != x[s] for x in xs):
+                failed.add(s)
+
+        for s in failed:
+            for j in range(len(xs)):
+                xs[j][s] = ys[j][s] = math.nan
+
+        return len(failed)
+
+    def velocities(self, rates):
+        """
+        How fast each joint moves as the links in rates ({link index: rate})
+        change length, the rest holding theirs. Differentiating every length
+        constraint at the current pose gives J v = rates, one linear solve,
+        done in the least squares sense since triangulated parts make some
+        of the rows redundant.
+        """
+
+        xs, ys, fixed = self.xs, self.ys, self.fixed
+        columns = {}
+        rows = []
+
+        for k in self.constrained:
+            a, b = self.j1[k], self.j2[k]
+            dx = xs[a] - xs[b]
+            dy = ys[a] - ys[b]
+            length = math.sqrt(dx * dx + dy * dy) or 1e-12
+            row = []
+
+            if not fixed[a]:
+                c = columns.setdefault(a, len(columns) * 2)
+                row += [(c, dx / length), (c + 1, dy / length)]
+            if not fixed[b]:
+                c = columns.setdefault(b, len(columns) * 2)
+                row += [(c, -dx / length), (c + 1, -dy / length)]
+
+            rows.append((rates.get(k, 0), row))
+
+        size = len(columns) * 2
+        jtj = [[0.0] * size for _ in range(size)]
+        jtb = [0.0] * size
+
+        for rate, row in rows:
+            for i, di in row:
+                jtb[i] += di * rate
+                for j, dj in row:
+                    jtj[i][j] += di * dj
+
+        # just enough to pin down joints hanging off a single link
+        for i in range(size):
+            jtj[i][i] += 1e-12
+
+        v = _solve_linear(jtj, jtb)
+        vx = array('d', [0.0] * len(self.joints))
+        vy = array('d', [0.0] * len(self.joints))
+
+        for joint, c in columns.items():
+            vx[joint], vy[joint] = v[c], v[c + 1]
+
+        return vx, vy
+
+    def rigid_bodies(self, constrained):
+        """
+        Find the rigid clusters in the constrained links. Each starts from a
+        triangle of links and takes in every joint tied to it by two or more
+        links, since those can't move relative to it either.
+
+        A body is (joints, seed link, steps, internal links), where the steps
+        build its shape outward from the seed link, dyad plan style.
+        """
+
+        neighbours = {}
+        for k in constrained:
+            a, b = self.j1[k], self.j2[k]
+            neighbours.setdefault(a, {})[b] = k
+            neighbours.setdefault(b, {})[a] = k
+
+        bodies = []
+
+        for k in constrained:
+            a, b = self.j1[k], self.j2[k]
+
+            if any(a in body[0] and b in body[0] for body in bodies):
+                continue
+
+            common = [c for c in neighbours[a] if c in neighbours[b]]
+            if not common:
+                continue
+
+            members = [a, b]
+            steps = []
+            grown = True
+
+            while grown:
+                grown = False
+
+                for joint in neighbours:
+                    if joint in members:
+                        continue
+
+                    anchors = [
+                        (other, link) for other, link in neighbours[joint].items()
+                        if other in members
+                    ]
+
+                    if len(anchors) >= 2:
+                        (ja, ka), (jb, kb) = anchors[:2]
+                        steps.append((joint, ja, ka, jb, kb))
+                        members.append(joint)
+                        grown = True
+
+            if all(self.fixed[j] for j in members):
+                continue
+
+            internal = {
+                link for link in constrained
+                if self.j1[link] in members and self.j2[link] in members
+            }
+            bodies.append((members, k, steps, internal))
+
+        return bodies
+
+    def solve_newton(self, bodies=(), residuals=None, tolerance=1e-9):
+        """
+        Damped gauss-newton over every constraint at once. Rigid bodies (see
+        rigid_bodies) are moved as one piece with an x, y and angle instead
+        of a pair of coords per joint, and the links inside them drop out of
+        the system entirely.
+        """
+
+        xs, ys, fixed, lengths = self.xs, self.ys, self.fixed, self.lengths
+        shapes = []
+
+        # each body's shape, built from its link lengths so it is exactly
+        # rigid, laid over where its joints are now
+        for members, seed, steps, _ in bodies:
+            a, b = self.j1[seed], self.j2[seed]
+            dx, dy = xs[b] - xs[a], ys[b] - ys[a]
+            scale = lengths[seed] / (math.sqrt(dx * dx + dy * dy) or 1e-12)
+            shape = {a: (xs[a], ys[a]), b: (xs[a] + dx * scale, ys[a] + dy * scale)}
+
+            for joint, ja, ka, jb, kb in steps:
+                point = _intersect(
+                    *shape[ja], lengths[ka],
+                    *shape[jb], lengths[kb],
+                    _side(xs[ja], ys[ja], xs[jb], ys[jb], xs[joint], ys[joint]),
+                )
+
+                if point is None:
+                    # not so rigid after all, solve it joint by joint
+                    return self.solve_newton(residuals=residuals, tolerance=tolerance)
+
+                shape[joint] = point
+
+            cx = sum(x for x, _ in shape.values()) / len(shape)
+            cy = sum(y for _, y in shape.values()) / len(shape)
+            shapes.append((cx, cy, {
+                joint: (x - cx, y - cy) for joint, (x, y) in shape.items()
+            }))
+
+        # the columns are x, y, angle per body, then x, y per free joint that
+        # isn't in a body. Joints belong to the first body they are found in
+        owners = {}
+        params = []
+        for i, (members, _, _, _) in enumerate(bodies):
+            for joint in members:
+                owners.setdefault(joint, i)
+            params += [0.0, 0.0, 0.0]
+
+        internal = set().union(*(body[3] for body in bodies))
+        links = [k for k in self.constrained if k not in internal]
+        columns = {}
+
+        for k in links:
+            for joint in (self.j1[k], self.j2[k]):
+                if fixed[joint] or joint in owners or joint in columns:
+                    continue
+                columns[joint] = len(params)
+                params += [xs[joint], ys[joint]]
+
+        def locate(joint, body=None):
+            """
+            (x, y, [(column, dx, dy)...]) of a joint, as placed by body or by
+            whatever owns it
+            """
+
+            if body is None:
+                if fixed[joint]:
+                    return xs[joint], ys[joint], ()
+                if joint in columns:
+                    c = columns[joint]
+                    return params[c], params[c + 1], ((c, 1, 0), (c + 1, 0, 1))
+                body = owners[joint]
+
+            cx, cy, offsets = shapes[body]
+            c = body * 3
+            cos, sin = math.cos(params[c + 2]), math.sin(params[c + 2])
+            ox, oy = offsets[joint]
+            rx, ry = ox * cos - oy * sin, ox * sin + oy * cos
+
+            return cx + params[c] + rx, cy + params[c + 1] + ry, \
+                ((c, 1, 0), (c + 1, 0, 1), (c + 2, -ry, rx))
+
+        # joints a body shares with something else (another body, or the
+        # frame when fixed) have to line up with it
+        shared = [
+            (joint, i)
+            for i, (members, _, _, _) in enumerate(bodies)
+            for joint in members
+            if fixed[joint] or owners[joint] != i
+        ]
+
+        def evaluate():
+            rows = []
+
+            for k in links:
+                xa, ya, da = locate(self.j1[k])
+                xb, yb, db = locate(self.j2[k])
+                dx, dy = xa - xb, ya - yb
+                current = math.sqrt(dx * dx + dy * dy) or 1e-12
+                ux, uy = dx / current, dy / current
+
+                rows.append((current - lengths[k], [
+                    (c, ux * ex + uy * ey) for c, ex, ey in da
+                ] + [
+                    (c, -ux * ex - uy * ey) for c, ex, ey in db
+                ]))
+
+            for joint, body in shared:
+                xa, ya, da = locate(joint, body)
+                xb, yb, db = locate(joint)
+                rows.append((xa - xb, [(c, ex) for c, ex, _ in da] + [
+                    (c, -ex) for c, ex, _ in db
+                ]))
+                rows.append((ya - yb, [(c, ey) for c, _, ey in da] + [
+                    (c, -ey) for c, _, ey in db
+                ]))
+
+            return rows
+
+        def write_back():
+            for joint in columns:
+                xs[joint], ys[joint] = params[columns[joint]], params[columns[joint] + 1]
+            for joint in owners:
+                if not fixed[joint]:
+                    xs[joint], ys[joint] = locate(joint)[:2]
+
+        size = len(params)
+        rows = evaluate()
+        count = 0
+        # levenberg-marquardt damping, shrinks as steps succeed so that we
+        # end up taking plain gauss-newton steps near the solution
+        damping = 1e-6
+
+        # each iteration is cheap and convergence is quadratic, so we can
+        # afford to go well past the relax engine's tolerance
+        while sum(abs(r) for r, _ in rows) > tolerance:
+            assert count < 100, 'unable to solve platform'
+
+            jtj = [[0.0] * size for _ in range(size)]
+            jtr = [0.0] * size
+            cost = 0
+
+            for residual, row in rows:
+                cost += residual * residual
+
+                for i, di in row:
+                    jtr[i] += di * residual
+                    for j, dj in row:
+                        jtj[i][j] += di * dj
+
+            start = params[:]
+
+            while True:
+                assert damping < 1e12, 'unable to solve platform'
+
+                m = [r[:] for r in jtj]
+                for i in range(size):
+                    m[i][i] += damping
+                step = _solve_linear(m, [-r for r in jtr])
+
+                params[:] = [p + d for p, d in zip(start, step)]
+                rows = evaluate()
+
+                if sum(r * r for r, _ in rows) < cost:
+                    damping = max(damping / 10, 1e-10)
+                    break
+
+                damping *= 10
+
+            count += 1
+
+            if residuals is not None:
+                residuals.append(sum(abs(r) for r, _ in rows))
+
+        write_back()
+        return count
+
+
+class SolveStats:
+    """
+    A record of one Platform.solve: the engine that did the work, how many
+    iterations it took (None when it gave up), the total error after each
+    iteration, wall time, and which links are furthest off their length at
+    the end. tolerance is the total error the solve stopped at.
+    """
+
+    def __init__(self, compiled, engine, iterations, residuals, seconds, tolerance):
+        self.engine = engine
+        self.iterations = iterations
+        self.residuals = residuals
+        self.time = seconds
+        self.residual = 0
+        self.worst_link = None
+        self.worst_error = 0
+        # links still further off their length than the whole platform is
+        # allowed to be
+        self.unconverged = []
+
+        xs, ys, lengths = compiled.xs, compiled.ys, compiled.lengths
+
+        for k in compiled.constrained:
+            a, b = compiled.j1[k], compiled.j2[k]
+            dx, dy = xs[b] - xs[a], ys[b] - ys[a]
+            error = abs(lengths[k] - math.sqrt(dx * dx + dy * dy))
+            name = compiled.linkages[k].name
+            self.residual += error
+
+            if error > self.worst_error:
+                self.worst_link, self.worst_error = name, error
+
+            if error > tolerance:
+                self.unconverged.append(name)
+
+    def __str__(self):
+        iterations = 'gave up' if self.iterations is None \
+            else f'{self.iterations} iterations'
+
+        return f'{self.engine}, {iterations}, residual {self.residual:.3g}, ' \
+            f'{self.time * 1000:.2f}ms, worst link {self.worst_link} ' \
+            f'({self.worst_error:.3g})'
+
+
+class SweepStats:
+    """
+    SolveStats for every solve along a sweep of the shock, as collected by
+    leverage_curve and quantized_leverage_curve
+    """
+
+    def __init__(self):
+        self.solves = []
+
+    def add(self, stats):
+        self.solves.append(stats)
+
+    @property
+    def iterations(self):
+        return [stats.iterations for stats in self.solves]
+
+    @property
+    def time(self):
+        return sum(stats.time for stats in self.solves)
+
+    @property
+    def worst(self):
+        return max(self.solves, key=lambda stats: stats.worst_error, default=None)
+
+    @property
+    def unconverged(self):
+        return sorted({link for stats in self.solves for link in stats.unconverged})
+
+    def __str__(self):
+        iterations = [i for i in self.iterations if i is not None]
+        summary = f'{len(self.solves)} solves, {sum(iterations)} iterations ' \
+            f'(max {max(iterations, default=0)}), {self.time * 1000:.1f}ms'
+
+        worst = self.worst
+        if worst is not None and worst.worst_link is not None:
+            summary += f', worst link {worst.worst_link} ({worst.worst_error:.3g})'
+
+        return summary
+
+
+def _side(ax, ay, bx, by, x, y):
+    """
+    Which side of the line a -> b the point is on, 1 for left, -1 for right
+    """
+
+    return 1 if (bx - ax) * (y - ay) - (by - ay) * (x - ax) >= 0 else -1
+
+
+def _intersect(ax, ay, ra, bx, by, rb, side):
+    """
+    Where the circle of radius ra around a meets the one of radius rb around
+    b, on the given side of a -> b. None if they don't meet.
+    """
+
+    dx = bx - ax
+    dy = by - ay
+    d = math.sqrt(dx * dx + dy * dy)
+
+    if not d:
+        return None
+
+    along = (ra * ra - rb * rb + d * d) / (2 * d)
+    h2 = ra * ra - along * along
+
+    # allowing a hair for rounding when they only just touch
+    if not h2 > -1e-9 * ra * ra:
+        return None
+
+    h = math.sqrt(max(h2, 0)) * side
+    px = ax + along * dx / d
+    py = ay + along * dy / d
+
+    return px - dy / d * h, py + dx / d * h
+
+
+def _solve_linear(a, b):
+    """
+    Solve a x = b for x with gaussian elimination (partial pivoting). The
+    systems here are tiny, a couple coords per joint, so no need for anything
+    fancy
+    """
+
+    n = len(b)
+
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        b[col], b[pivot] = b[pivot], b[col]
+
+        if a[col][col] == 0:
+            continue
+
+        for r in range(col + 1, n):
+            factor = a[r][col] / a[col][col]
+            if factor == 0:
+                continue
+            for c in range(col, n):
+                a[r][c] -= factor * a[col][c]
+            b[r] -= factor * b[col]
+
+    x = [0.0] * n
+
+    for r in reversed(range(n)):
+        if a[r][r] == 0:
+            continue
+        x[r] = (b[r] - sum(a[r][c] * x[c] for c in range(r + 1, n))) / a[r][r]
+
+    return x
+
+
 class Bike:
     def __init__(self,
                  platform,
@@ -199,11 +1182,39 @@ class Bike:
         if shock_shadow:
             self.shock_shadow_starting_length = shock_shadow.current_length
 
+    def default_engine(self):
+        """
+        dyads if the linkage breaks down into dyads with the shock (and its
+        shadow) held at a length, as a sweep holds them, newton otherwise
+        """
+
+        compiled = self.platform.compiled or self.platform.compile()
+        held = {
+            compiled.linkages.index(link)
+            for link in (self.shock, self.shock_shadow) if link
+        }
+        constrained = tuple(sorted(held.union(compiled.constrained)))
+
+        if constrained not in compiled.plans:
+            compiled.plans[constrained] = compiled.plan(constrained)
+
+        return 'dyads' if compiled.plans[constrained] is not None else 'newton'
+
     @staticmethod
-    def from_datasheet(datasheet):
-        file = open(datasheet)
-        data = json.loads(file.read())
-        file.close()
+    @phase('datasheet load')
+    def from_datasheet(datasheet, engine=None):
+        """
+        Build a bike from a datasheet file, or one already loaded (from a
+        store.DatasheetStore say). Unless an engine is asked for, bikes whose
+        linkage breaks down into dyads (most of them) are solved in closed
+        form, and the rest with the (rigid body aware) newton engine.
+        """
+
+        if isinstance(datasheet, dict):
+            data = datasheet
+        else:
+            with open(datasheet) as file:
+                data = json.loads(file.read())
 
         joints = {}
         axle = None
@@ -237,7 +1248,7 @@ class Bike:
 
         assert axle is not None, 'no axle is defined'
 
-        platform = Platform()
+        platform = Platform(engine or 'relax')
         shock = None
         # a shock_shadow is a link that adds and removes length along with the
         # shock when it moves through the travel. This is used for inline angle
@@ -276,7 +1287,10 @@ class Bike:
         assert eye2eye is not None, 'eyetoeye not defined'
         assert stroke is not None, 'stroke not defined'
 
-        return Bike(
+        # as picked by tune_solver, see bikes.py tune
+        platform.tolerance = data.get('solver', {}).get('tolerance')
+
+        bike = Bike(
             platform,
             joints,
             shock,
@@ -286,16 +1300,121 @@ class Bike:
             shock_shadow,
         )
 
+        if engine is None:
+            platform.engine = bike.default_engine()
 
-class PlatformTest(unittest.TestCase):
-    def test_basic_platform(self):
-        """
-        Most basic suspension platform possible (single pivot shock on axle)
+        return bike
 
-            *
-           /
-          /
-         /
+
+class Trajectory:
+    """
+    A solved sweep of the shock through its stroke, kept in a file that is
+    memory mapped rather than read. The poses are float64 coordinates laid
+    out joint by joint, then step by step, then x, y, behind a small header:
+
+    magic, joint count, step count, shock travel, joint names (json)
+
+    Step 0 is the rest pose and step i has the shock shortened by i/steps of
+    its travel (the same steps leverage_curve and draw take), so every
+    consumer can read poses out of the one file instead of solving again.
+    """
+
+    magic = b'LEVTRAJ1'
+    header = struct.Struct('<8sIId')
+
+    def __init__(self, path):
+        self.file = path
+
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, joints, steps, self.shock_travel = \
+            self.header.unpack_from(self.mmap)
+        assert magic == self.magic, f'{path} is not a trajectory'
+
+        self.steps = steps
+        offset = self.header.size
+        names_size, = struct.unpack_from('<I', self.mmap, offset)
+        offset += 4
+        self.names = json.loads(self.mmap[offset:offset + names_size])
+        offset += names_size
+        offset += -offset % 8
+
+        self.data = memoryview(self.mmap)[offset:].cast('d')
+        assert len(self.data) == joints * (steps + 1) * 2, \
+            f'{path} is truncated'
+
+    @staticmethod
+    def record(bike, path, steps=100, continuation=False, stats=None):
+        """
+        Solve the sweep of bike (from its rest pose, see sweep) and save it
+        to path. Pass a SweepStats as stats to collect the SolveStats of every
+        step.
+        """
+
+        poses = [
+            bike.platform.pose()
+            for _ in sweep(bike, steps, continuation, stats)
+        ]
+        max_shock_diff = _shock_travel(bike)
+
+        joints = bike.platform.compiled.joints
+        names = json.dumps([joint.name for joint in joints]).encode('utf-8')
+        data = array('d')
+
+        for j in range(len(joints)):
+            for xs, ys in poses:
+                data.extend((xs[j], ys[j]))
+
+        header = Trajectory.header.pack(
+            Trajectory.magic, len(joints), steps, max_shock_diff,
+        )
+        header += struct.pack('<I', len(names)) + names
+        header += bytes(-len(header) % 8)
+
+        # others may have the old one mapped
+        with atomic_write(path, 'wb') as file:
+            file.write(header)
+            data.tofile(file)
+
+        return Trajectory(path)
+
+    def path(self, name):
+        """
+        (xs, ys) of a joint at every step, as views into the file
+        """
+
+        j = self.names.index(name)
+        start = j * (self.steps + 1) * 2
+        end = start + (self.steps + 1) * 2
+
+        return self.data[start:end:2], self.data[start + 1:end:2]
+
+    def pose(self, step):
+        """
+        (xs, ys) of every joint at step, in platform order, ready for
+        Platform.set_pose
+        """
+
+        stride = (self.steps + 1) * 2
+        start = step * 2
+
+        return self.data[start::stride], self.data[start + 1::stride]
+
+    def close(self):
+        self.data.release()
+        self.mmap.close()
+
+
+class PlatformTest(unittest.TestCase):
+    def test_basic_platform(self):
+        """
+        Most basic suspension platform possible (single pivot shock on axle)
+
+            *
+           /
+          /
+         /
         *---*
 
         / = shock (am considering this a linkage)
@@ -591,6 +1710,760 @@ class PlatformTest(unittest.TestCase):
         )
 
 
+class NewtonPlatformTest(unittest.TestCase):
+    """
+    The same platforms as PlatformTest, solved all at once with the newton
+    engine. Newton lands (much) closer to the exact answer than the relax
+    engine does, so we check against the exact geometry here
+    """
+
+    def basic_platform(self, quadrant):
+        sx, sy = quadrant
+
+        j1 = Joint(0, 0, 'axle')
+
+        j2 = Joint(10 * sx, 0, 'pivot')
+        j2.constrain_coord()
+
+        j3 = Joint(10 * sx, 10 * sy, 'shock_mount')
+        j3.constrain_coord()
+
+        platform = Platform(engine='newton')
+
+        swing_arm = platform.add_linkage(j1, j2, name='swing_arm')
+        swing_arm.constrain_length()
+
+        shock = platform.add_linkage(j1, j3, name='shock')
+        shock.constrain_length()
+
+        return platform, shock, j1, j2, j3
+
+    def test_basic_platform_all_quadrants(self):
+        for quadrant in [(1, 1), (-1, 1), (-1, -1), (1, -1)]:
+            sx, sy = quadrant
+            platform, shock, j1, j2, j3 = self.basic_platform(quadrant)
+
+            self.assertEqual(platform.solve(), 0)
+            self.assertEqual((j1.x, j1.y), (0, 0))
+
+            shock.constrain_length(10)
+            platform.solve()
+            self.assertAlmostEqual(j1.x, sx * (10 - 5 * math.sqrt(3)))
+            self.assertAlmostEqual(j1.y, sy * 5)
+            self.assertEqual((j2.x, j2.y), (10 * sx, 0))
+            self.assertEqual((j3.x, j3.y), (10 * sx, 10 * sy))
+
+            shock.constrain_length(15)
+            platform.solve()
+            self.assertAlmostEqual(j1.x, sx * (10 - math.sqrt(100 - 1.25 ** 2)))
+            self.assertAlmostEqual(j1.y, sy * -1.25)
+
+    def test_matches_relax_engine(self):
+        platform, shock, j1, _, _ = self.basic_platform((1, 1))
+        shock.constrain_length(10)
+        platform.solve(engine='relax')
+        relaxed = j1.x, j1.y
+
+        platform, shock, j1, _, _ = self.basic_platform((1, 1))
+        shock.constrain_length(10)
+        platform.solve()
+        self.assertAlmostEqual(j1.x, relaxed[0], places=4)
+        self.assertAlmostEqual(j1.y, relaxed[1], places=4)
+
+    def test_vertical_and_horizontal_linkage(self):
+        j1 = Joint(0, 10, 'top')
+        j1.constrain_coord()
+        j2 = Joint(0, 0, 'bottom')
+        platform = Platform(engine='newton')
+        platform.add_linkage(j1, j2, name='link').constrain_length(15)
+        platform.solve()
+        self.assertEqual(j2.x, 0)
+        self.assertAlmostEqual(j2.y, -5)
+
+        j1 = Joint(0, 0, 'left')
+        j1.constrain_coord()
+        j2 = Joint(10, 0, 'right')
+        platform = Platform(engine='newton')
+        platform.add_linkage(j1, j2, name='link').constrain_length(15)
+        platform.solve()
+        self.assertAlmostEqual(j2.x, 15)
+        self.assertEqual(j2.y, 0)
+
+    def test_converges_quadratically(self):
+        relaxed, newton = patrol(), patrol()
+
+        for bike in (relaxed, newton):
+            bike.shock.constrain_length(bike.shock_starting_length * 0.85)
+
+        relaxed.platform.solve()
+        stats = newton.platform.solve(engine='newton', stats=True)
+        residuals = stats.residuals
+
+        self.assertLess(newton.platform.error, 1e-9)
+
+        # once close, each step squares the error (a linear method would
+        # only take a fixed fraction off it)
+        close = [(a, b) for a, b in zip(residuals, residuals[1:]) if a < 1]
+        self.assertGreaterEqual(len(close), 2)
+        for a, b in close:
+            self.assertLessEqual(b, a * a)
+
+        for name, joint in newton.joints.items():
+            self.assertAlmostEqual(joint.x, relaxed.joints[name].x, places=2)
+            self.assertAlmostEqual(joint.y, relaxed.joints[name].y, places=2)
+
+
+class SolveStatsTest(unittest.TestCase):
+    def test_stats(self):
+        bike = patrol()
+        bike.shock.constrain_length(bike.shock_starting_length * 0.9)
+        stats = bike.platform.solve(engine='newton', stats=True)
+
+        self.assertEqual(stats.engine, 'newton')
+        self.assertEqual(len(stats.residuals), stats.iterations)
+        self.assertEqual(stats.residuals, sorted(stats.residuals, reverse=True))
+        self.assertLess(stats.residual, 1e-9)
+        self.assertIn(stats.worst_link, bike.platform.linkages)
+        self.assertEqual(stats.unconverged, [])
+
+    def test_stats_on_failure(self):
+        bike = patrol()
+        # further than the linkage can physically reach
+        bike.shock.constrain_length(bike.shock_starting_length * 3)
+
+        with self.assertRaises(AssertionError) as raised:
+            bike.platform.solve(engine='newton')
+
+        stats = bike.platform.last_stats
+        self.assertIsNone(stats.iterations)
+        self.assertIn('shock', stats.unconverged)
+        self.assertIn(str(stats), str(raised.exception))
+
+    def test_unconverged_against_tolerance(self):
+        bike = Bike.from_datasheet('datasheets/yt-tues-2025.json')
+        bike.platform.tolerance = 1e-3
+        bike.shock.constrain_length(bike.shock_starting_length * 0.9)
+        stats = bike.platform.solve(stats=True)
+
+        # further off than the default tolerance, but not the one asked for
+        self.assertGreater(stats.worst_error, 0.00001)
+        self.assertEqual(stats.unconverged, [])
+
+    def test_sweep_stats(self):
+        stats = SweepStats()
+        leverage_curve(firebird(), stats=stats, steps=10)
+
+        self.assertEqual(len(stats.solves), 10)
+        self.assertEqual(stats.iterations, [s.iterations for s in stats.solves])
+        self.assertEqual(stats.unconverged, [])
+        self.assertIn('10 solves', str(stats))
+
+
+class CompiledPlatformTest(unittest.TestCase):
+    def test_objects_are_views_over_arrays(self):
+        bike = patrol()
+        compiled = bike.platform.compile()
+
+        self.assertEqual(len(compiled.xs), len(bike.joints))
+        self.assertEqual(len(compiled.j1), len(bike.platform.linkages))
+        self.assertEqual(sum(compiled.fixed), 3)
+
+        axle = bike.joints['axle']
+        i = compiled.joints.index(axle)
+        compiled.xs[i] += 1
+        self.assertEqual(axle.x, compiled.xs[i])
+        axle.y = 5
+        self.assertEqual(compiled.ys[i], 5)
+
+        # the shock is the only unconstrained link
+        k = compiled.linkages.index(bike.shock)
+        self.assertEqual(compiled.constrained, [
+            n for n in range(len(compiled.lengths)) if n != k
+        ])
+        bike.shock.constrain_length(100)
+        self.assertEqual(compiled.lengths[k], 100)
+
+    def test_error_matches_linkages(self):
+        bike = firebird()
+        bike.shock.constrain_length(bike.shock_starting_length * 0.9)
+        compiled = bike.platform.compile()
+
+        self.assertAlmostEqual(compiled.error(), sum(
+            abs(link.error) for link in bike.platform.linkages.values()
+        ))
+
+    def test_relax_matches_linkage_adjust(self):
+        # the cached lengths and running total should land on exactly what
+        # sweeping Linkage.adjust and summing every error would
+        solved, swept = patrol(), patrol()
+
+        for bike in (solved, swept):
+            bike.shock.constrain_length(bike.shock_starting_length * 0.9)
+
+        count = solved.platform.solve(engine='relax')
+
+        linkages = swept.platform.linkages.values()
+        for _ in range(count):
+            for link in linkages:
+                link.adjust()
+
+        self.assertLessEqual(sum(abs(link.error) for link in linkages), 0.00001)
+
+        for name, joint in solved.joints.items():
+            self.assertEqual(joint.x, swept.joints[name].x)
+            self.assertEqual(joint.y, swept.joints[name].y)
+
+    def test_adding_linkage_recompiles(self):
+        bike = patrol()
+        bike.platform.solve()
+        self.assertIsNotNone(bike.platform.compiled)
+
+        extra = Joint(0, 0, 'extra')
+        bike.platform.add_linkage(bike.joints['axle'], extra, name='extra')
+        self.assertIsNone(bike.platform.compiled)
+        self.assertEqual(len(bike.platform.compile().xs), len(bike.joints) + 1)
+
+
+class LeverageCurveTest(unittest.TestCase):
+    def test_continuation_saves_iterations(self):
+        for engine in ('relax', 'newton'):
+            plain, predicted = SweepStats(), SweepStats()
+
+            bike = firebird()
+            bike.platform.engine = engine
+            expected = leverage_curve(bike, stats=plain)
+
+            bike = firebird()
+            bike.platform.engine = engine
+            actual = leverage_curve(bike, continuation=True, stats=predicted)
+
+            self.assertEqual(len(predicted.solves), len(plain.solves))
+            self.assertLess(sum(predicted.iterations) * 1.4, sum(plain.iterations))
+
+            for expected_y, actual_y in zip(expected[1], actual[1]):
+                self.assertAlmostEqual(expected_y, actual_y, places=3)
+
+    def test_analytic_matches_finite_difference(self):
+        for fixture in (patrol, firebird):
+            bike = fixture()
+            bike.platform.engine = 'newton'
+            axle = bike.joints['axle']
+
+            bike.shock.constrain_length(bike.shock_starting_length - 5)
+            bike.platform.solve()
+            velocity = bike.platform.velocities({bike.shock: 1})[axle]
+            x, y = axle.x, axle.y
+
+            h = 1e-4
+            bike.shock.constrain_length(bike.shock_starting_length - 5 + h)
+            bike.platform.solve()
+
+            self.assertAlmostEqual(velocity[0], (axle.x - x) / h, places=3)
+            self.assertAlmostEqual(velocity[1], (axle.y - y) / h, places=3)
+
+    def test_analytic_curve(self):
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        x_data, y_data = leverage_curve(bike, steps=20, analytic=True)
+
+        self.assertEqual(len(x_data), 21)
+        self.assertEqual(x_data[0], 0)
+
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        fine = quantized_leverage_curve(bike, steps=1000)
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        analytic = quantized_leverage_curve(bike, steps=100, analytic=True)
+
+        for expected_y, actual_y in zip(fine[1], analytic[1]):
+            self.assertAlmostEqual(expected_y, actual_y, delta=0.01)
+
+    def test_adaptive_steps(self):
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        fixed = quantized_leverage_curve(bike, steps=400)
+
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        stats = SweepStats()
+        adaptive = quantized_leverage_curve(
+            bike,
+            accuracy=0.002,
+            stats=stats,
+        )
+
+        # every solve is counted, including the rejected ones
+        self.assertLess(len(stats.solves), 100)
+
+        for expected_y, actual_y in zip(fixed[1], adaptive[1]):
+            self.assertAlmostEqual(expected_y, actual_y, delta=0.02)
+
+
+class NormalizeStrokeTest(unittest.TestCase):
+    def correct(self, x_data, y_data, stroke):
+        # the iterative correction leverage_curve used to do
+        def error(y_data):
+            x_deltas = [d[1] - d[0] for d in zip(x_data[:-1], x_data[1:])]
+            area = sum(d[0]/d[1] for d in zip(x_deltas, y_data))
+            return (area - stroke) / stroke
+
+        corrections = 0
+        while abs(error(y_data)) > 1e-5 and corrections < 10_000:
+            adjustment = min(y_data) * 1e-5
+            if error(y_data) < 0:
+                y_data = [d - adjustment for d in y_data]
+            else:
+                y_data = [d + adjustment for d in y_data]
+            corrections += 1
+
+        return y_data
+
+    def test_matches_iterative_correction(self):
+        x_data = [x * 1.6 for x in range(101)]
+        y_data = [3.2 - x * 0.004 + math.sin(x / 20) * 0.1 for x in x_data]
+
+        for stroke in (55, 55.5, 56):
+            expected = self.correct(x_data, y_data, stroke)
+            actual = normalize_stroke(x_data, y_data, stroke)
+
+            for expected_y, actual_y in zip(expected, actual):
+                self.assertAlmostEqual(expected_y, actual_y, delta=1e-4)
+
+            x_deltas = [b - a for a, b in zip(x_data[:-1], x_data[1:])]
+            area = sum(dx / y for dx, y in zip(x_deltas, actual))
+            self.assertAlmostEqual(area, stroke, places=9)
+
+    def test_past_iterative_correction_cap(self):
+        # a flat 2.5 over 160mm only makes 64mm of an 80mm stroke, and the
+        # old loop ran out of passes well short of the 2.0 it takes (as it
+        # did for the gamblers, the status 2s and the spindrift)
+        x_data = [x * 1.6 for x in range(101)]
+        y_data = [2.5] * 100
+
+        expected = self.correct(x_data, y_data, 80)
+        actual = normalize_stroke(x_data, y_data, 80)
+
+        for y in actual:
+            self.assertAlmostEqual(y, 2.0, places=9)
+
+        self.assertGreater(expected[0] - actual[0], 0.2)
+
+    def test_batch(self):
+        x_data = [x * 1.5 for x in range(11)]
+        curves = [
+            (x_data, [2.5 + x / 100 for x in x_data], 6.5),
+            (x_data, [3.0 - x / 100 for x in x_data], 5.0),
+        ]
+
+        self.assertEqual(
+            normalize_strokes(curves),
+            [normalize_stroke(*curve) for curve in curves],
+        )
+
+
+class ResampleTest(unittest.TestCase):
+    def test_linear(self):
+        x_data = [0, 1, 3, 4]
+        y_data = [1, 2, 6, 4]
+
+        self.assertEqual(
+            resample(x_data, y_data, [-1, 0, 0.5, 2, 3.5, 4, 5]),
+            [1, 1, 1.5, 4, 5, 4, 4],
+        )
+
+    def test_monotone(self):
+        x_data = [0, 1, 2, 3, 4]
+        y_data = [0, 0, 1, 1, 1]
+        xs = [x / 10 for x in range(41)]
+        ys = resample(x_data, y_data, xs, monotone=True)
+
+        # passes through the samples, without overshooting them
+        for x, y in zip(x_data, y_data):
+            self.assertAlmostEqual(ys[xs.index(x)], y)
+        for a, b in zip(ys[:-1], ys[1:]):
+            self.assertLessEqual(a, b)
+        self.assertLessEqual(max(ys), 1)
+
+    def test_resolutions_from_one_sweep(self):
+        stats = SweepStats()
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        curves = quantized_leverage_curves(bike, stats=stats)
+
+        self.assertEqual(len(stats.solves), 100)
+        self.assertEqual(sorted(curves), [6, 11, 21, 101])
+
+        for resolution in (6, 21):
+            bike = firebird()
+            bike.platform.engine = 'newton'
+            x_data, y_data = quantized_leverage_curve(bike, resolution=resolution)
+
+            self.assertEqual(len(x_data), resolution)
+            self.assertEqual(curves[resolution], (x_data, y_data))
+
+
+class TrajectoryTest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'firebird.traj')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_record(self):
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        rest = bike.platform.pose()
+        Trajectory.record(bike, self.path, steps=10).close()
+
+        trajectory = Trajectory(self.path)
+        self.assertEqual(trajectory.steps, 10)
+        self.assertEqual(list(trajectory.pose(0)[0]), list(rest[0]))
+        self.assertEqual(list(trajectory.pose(10)[1]), list(bike.platform.pose()[1]))
+
+        xs, ys = trajectory.path('axle')
+        self.assertIsInstance(ys, memoryview)
+        self.assertEqual(len(ys), 11)
+        self.assertEqual(ys[0], rest[1][trajectory.names.index('axle')])
+        self.assertGreater(ys[-1], ys[0])
+
+        del xs, ys
+        trajectory.close()
+
+    def test_leverage_curve(self):
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        expected = leverage_curve(bike)
+
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        trajectory = Trajectory.record(bike, self.path)
+
+        stats = SweepStats()
+        bike = firebird()
+        actual = leverage_curve(bike, stats=stats, trajectory=trajectory)
+
+        # nothing solved, all read back
+        self.assertEqual(stats.solves, [])
+        for expected_y, actual_y in zip(expected[1], actual[1]):
+            self.assertAlmostEqual(expected_y, actual_y, places=9)
+
+        trajectory.close()
+
+
+class MeasureTest(unittest.TestCase):
+    def test_one_pass(self):
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        expected = leverage_curve(bike)
+
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        stats = SweepStats()
+        leverage, path, progression, ratio = measure(
+            bike,
+            [Leverage(bike), AxlePath(bike), Progression(bike), VelocityRatio(bike)],
+            stats=stats,
+        )
+
+        self.assertEqual(len(stats.solves), 100)
+        self.assertEqual(leverage, expected)
+        self.assertEqual(path[0], (0, 0))
+        self.assertAlmostEqual(path[-1][1], bike.travel)
+        self.assertAlmostEqual(
+            progression,
+            (expected[1][0] - expected[1][-1]) / expected[1][0] * 100,
+        )
+
+        # the velocity ratio is the reciprocal of the leverage, give or take
+        # it being the exact one rather than the average over a step
+        self.assertEqual(len(ratio[0]), 101)
+        for x, y in zip(*expected):
+            self.assertAlmostEqual(1 / y, resample(*ratio, [x])[0], delta=0.01)
+
+    def test_instant_centre(self):
+        bike = patrol()
+        bike.platform.engine = 'newton'
+        centre = InstantCentre(bike)
+        measure(bike, [centre], steps=10)
+
+        # a four bar turns about where its links' lines cross
+        joints = bike.joints
+        a, b = joints['chainstay left'], joints['chainstay right']
+        c, d = joints['seatstay top'], joints['triangle bottom']
+        x, y = _solve_linear(
+            [[b.y - a.y, a.x - b.x], [d.y - c.y, c.x - d.x]],
+            [(b.y - a.y) * a.x + (a.x - b.x) * a.y, (d.y - c.y) * c.x + (c.x - d.x) * c.y],
+        )
+
+        self.assertAlmostEqual(centre.centres[-1][0], x, places=6)
+        self.assertAlmostEqual(centre.centres[-1][1], y, places=6)
+
+        # and relative to the axle at rest, in mm
+        scale = bike.travel / (centre.axle_ys[-1] - centre.axle_ys[0])
+        result = centre.result()
+        self.assertEqual(len(result), 11)
+        self.assertAlmostEqual(result[-1][0], (x - centre.axle_xs[0]) * scale, places=6)
+        self.assertAlmostEqual(result[-1][1], (y - centre.axle_ys[0]) * scale, places=6)
+        self.assertNotEqual(centre.axle_xs[0], joints['axle'].x)
+
+
+class TuneSolverTest(unittest.TestCase):
+    def test_tune(self):
+        def load():
+            bike = firebird()
+            bike.platform.engine = 'newton'
+            return bike
+
+        pick, trials = tune_solver(
+            load,
+            max_error=0.02,
+            steps=(10, 50),
+            tolerances=(1e-3, 1e-9),
+        )
+
+        self.assertEqual(len(trials), 4)
+        self.assertEqual(pick[:2], (50, 1e-3))
+
+        for trial in trials:
+            if trial[4] <= 0.02:
+                self.assertLessEqual(pick[2], trial[2])
+
+    def test_tune_dyads(self):
+        def load():
+            bike = firebird()
+            bike.platform.engine = 'dyads'
+            return bike
+
+        pick, trials = tune_solver(load, max_error=0.02, steps=(10, 50))
+
+        self.assertEqual([trial[:2] for trial in trials], [(10, None), (50, None)])
+        self.assertIsNone(pick[1])
+
+
+class ShockLeverageCurvesTest(unittest.TestCase):
+    def test_stock_shock(self):
+        for fixture in (patrol, firebird):
+            bike = fixture()
+            bike.platform.engine = 'newton'
+            expected = leverage_curve(bike)
+
+            bike = fixture()
+            bike.platform.engine = 'newton'
+            shocks = [(bike.eye2eye, bike.stroke), (bike.eye2eye + 5, bike.stroke - 5)]
+            curves = shock_leverage_curves(bike, shocks)
+
+            for expected_y, actual_y in zip(expected[1], curves[shocks[0]][1]):
+                self.assertAlmostEqual(expected_y, actual_y, places=4)
+
+            # less stroke, less travel
+            self.assertEqual(curves[shocks[0]][0][-1], bike.travel)
+            self.assertLess(curves[shocks[1]][0][-1], bike.travel)
+
+    def test_leaves_bike_at_rest(self):
+        bike = firebird()
+        rest = bike.platform.pose()
+        shock_leverage_curves(bike, [(bike.eye2eye, bike.stroke)], steps=20)
+
+        self.assertEqual(bike.platform.pose(), rest)
+        self.assertAlmostEqual(bike.shock.current_length, bike.shock_starting_length)
+
+
+class UncertaintyTest(unittest.TestCase):
+    def test_no_noise_is_the_curve(self):
+        for fixture in (patrol, firebird):
+            bike = fixture()
+            bike.platform.engine = 'newton'
+            expected = quantized_leverage_curve(bike, normalized=True)
+
+            quantized, curve, failed = leverage_uncertainty(
+                fixture(), samples=3, sigma=0,
+            )
+
+            self.assertEqual(failed, 0)
+            self.assertEqual(quantized.x, expected[0])
+            for y, mean, low, high in zip(expected[1], quantized.mean, quantized.low, quantized.high):
+                self.assertAlmostEqual(y, mean, places=6)
+                self.assertEqual(low, high)
+
+    def test_band(self):
+        quantized, curve, failed = leverage_uncertainty(
+            patrol(), samples=200, sigma=0.5, seed=1,
+        )
+
+        self.assertLess(failed, 200)
+        self.assertEqual(len(curve.x), 101)
+
+        for band in (quantized, curve):
+            for mean, low, high in zip(band.mean, band.low, band.high):
+                self.assertLess(low, mean)
+                self.assertLess(mean, high)
+
+    def test_leaves_bike_alone(self):
+        def geometry(compiled):
+            # repr, so that the nan lengths of free links compare equal
+            return repr((compiled.xs, compiled.ys, compiled.lengths))
+
+        # no dyads plan, so solved sample by sample through its own arrays
+        bike = Bike.from_datasheet('datasheets/atherton-a-170-2025.json')
+        # the shock is held at its length at rest, as for a sweep
+        bike.shock.constrain_length(bike.shock_starting_length)
+        self.assertIsNone(bike.platform.plan())
+        before = geometry(bike.platform.compile())
+
+        leverage_uncertainty(bike, samples=3, sigma=1, steps=5, seed=1)
+
+        self.assertEqual(geometry(bike.platform.compiled), before)
+
+
+class DyadsPlatformTest(unittest.TestCase):
+    def test_basic_platform_is_exact(self):
+        j1 = Joint(0, 0, 'axle')
+        j2 = Joint(10, 0, 'pivot')
+        j2.constrain_coord()
+        j3 = Joint(10, 10, 'shock_mount')
+        j3.constrain_coord()
+
+        platform = Platform(engine='dyads')
+        platform.add_linkage(j1, j2, name='swing_arm').constrain_length()
+        shock = platform.add_linkage(j1, j3, name='shock')
+        shock.constrain_length(10)
+
+        self.assertEqual(len(platform.plan()), 1)
+        self.assertEqual(platform.solve(), 1)
+        self.assertAlmostEqual(j1.x, 10 - 5 * math.sqrt(3), places=12)
+        self.assertAlmostEqual(j1.y, 5, places=12)
+
+    def test_matches_newton(self):
+        for fixture in (patrol, firebird):
+            dyads, newton = fixture(), fixture()
+
+            for bike in (dyads, newton):
+                bike.shock.constrain_length(bike.shock_starting_length * 0.8)
+
+            self.assertEqual(dyads.platform.solve(engine='dyads'), 1)
+            newton.platform.solve(engine='newton')
+
+            for name, joint in dyads.joints.items():
+                self.assertAlmostEqual(joint.x, newton.joints[name].x)
+                self.assertAlmostEqual(joint.y, newton.joints[name].y)
+
+    def test_falls_back(self):
+        j1 = Joint(0, 10, 'top')
+        j1.constrain_coord()
+        j2 = Joint(0, 0, 'bottom')
+
+        platform = Platform(engine='dyads')
+        platform.add_linkage(j1, j2, name='link').constrain_length(15)
+
+        # one link can't pin the bottom joint down
+        self.assertIsNone(platform.plan())
+        platform.solve()
+        self.assertAlmostEqual(j2.y, -5)
+
+    def test_datasheet_engine(self):
+        dyads = Bike.from_datasheet('datasheets/pivot-firebird-2025.json')
+        self.assertEqual(dyads.platform.engine, 'dyads')
+
+        # shock drives the rear triangle directly, no dyads to be found
+        newton = Bike.from_datasheet('datasheets/yt-tues-2025.json')
+        self.assertEqual(newton.platform.engine, 'newton')
+
+    def test_default_engine(self):
+        # the fixtures leave their shock free until a sweep holds it, which
+        # mustn't hide the dyads
+        for fixture in (patrol, firebird):
+            bike = fixture()
+            self.assertIsNone(bike.platform.plan())
+            self.assertEqual(bike.default_engine(), 'dyads')
+            self.assertIsNone(bike.shock.constrained_length)
+
+
+class RigidBodiesTest(unittest.TestCase):
+    def test_finds_triangles(self):
+        bike = patrol()
+        bike.shock.constrain_length()
+        bodies = bike.platform.rigid_bodies()
+        joints = bike.platform.compiled.joints
+
+        self.assertEqual(
+            [sorted(joints[j].name for j in body[0]) for body in bodies],
+            [
+                ['axle', 'chainstay left', 'seatstay top'],
+                ['seatstay top', 'shock top', 'triangle bottom'],
+            ]
+        )
+
+        # the shock and chainstay are all that's left between the bodies
+        self.assertEqual(len(set().union(*(body[3] for body in bodies))), 6)
+
+    def test_matches_joint_by_joint(self):
+        for fixture in (patrol, firebird):
+            bodies, joints = fixture(), fixture()
+
+            for bike in (bodies, joints):
+                bike.shock.constrain_length(bike.shock_starting_length * 0.8)
+
+            bodies.platform.solve(engine='newton')
+            self.assertTrue(bodies.platform.rigid_bodies())
+            joints.platform.compile().solve_newton()
+
+            for name, joint in bodies.joints.items():
+                self.assertAlmostEqual(joint.x, joints.joints[name].x)
+                self.assertAlmostEqual(joint.y, joints.joints[name].y)
+
+    def test_driven_link_inside_body(self):
+        # the shock, shock shadow and yoke make a triangle that changes shape
+        # as the shock moves
+        datasheet = 'datasheets/specialized-status-2-170-2025.json'
+        newton = Bike.from_datasheet(datasheet, engine='newton')
+        dyads = Bike.from_datasheet(datasheet, engine='dyads')
+
+        for bike in (newton, dyads):
+            bike.shock.constrain_length(bike.shock_starting_length - 10)
+            bike.shock_shadow.constrain_length(bike.shock_shadow_starting_length - 10)
+            bike.platform.solve()
+
+        for name, joint in newton.joints.items():
+            self.assertAlmostEqual(joint.x, dyads.joints[name].x)
+            self.assertAlmostEqual(joint.y, dyads.joints[name].y)
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'firebird.svg')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_strip(self):
+        try:
+            import matplotlib
+        except ImportError:
+            self.skipTest('needs matplotlib')
+
+        bike = firebird()
+        bike.platform.engine = 'newton'
+        trajectory = Trajectory.record(bike, os.path.join(self.tmp.name, 'sweep.traj'), steps=10)
+        bike.platform.set_pose(trajectory.pose(0))
+
+        try:
+            export(bike, self.path, trajectory, strip=3)
+        finally:
+            trajectory.close()
+
+        with open(self.path) as file:
+            self.assertIn('<svg', file.read())
+
+    def test_strip_too_short(self):
+        with self.assertRaises(AssertionError):
+            export(firebird(), self.path, strip=1)
+
+
 def patrol():
     # a dump from sim.html of a transition patrol
     # (complete bike image)
@@ -704,31 +2577,55 @@ def firebird():
     )
 
 
-def draw(bike):
+def _frame(ax, bike):
+    """
+    Fit the axes around the bike as it is now, with room for it to move
+    """
+
+    min_x = min(j.x for j in bike.joints.values())
+    max_x = max(j.x for j in bike.joints.values())
+    min_y = min(j.y for j in bike.joints.values())
+    max_y = max(j.y for j in bike.joints.values())
+    padding_x = (0.2 * (max_x - min_x));
+    padding_y = (0.4 * (max_y - min_y));
+
+    ax.set_xlim([min_x - padding_x, max_x + padding_x])
+    ax.set_ylim([min_y - padding_y, max_y + padding_y])
+    ax.set_aspect(1)
+
+
+def draw(bike, trajectory=None):
+    """
+    Animate the bike through its travel. Frames come from trajectory when
+    given (see Trajectory), and are solved as they are first shown if not.
+    """
+
     import matplotlib.pyplot as plt
     import matplotlib.animation as animation
 
     fig, ax = plt.subplots()
 
     fps = 30
-    frames = 100
+    frames = trajectory.steps if trajectory else 100
     forward = [i for i in range(frames + 1)]
     back = [i for i in range(1, frames)]
     back.reverse()
     all_frames = forward + back
     interval = int(1_000 / fps)
 
-    max_percent = bike.stroke / bike.eye2eye
-    ending_length = bike.shock_starting_length * (1 - max_percent)
-    max_shock_diff = bike.shock_starting_length - ending_length
+    max_shock_diff = _shock_travel(bike)
 
-    cached = [None] * 101
+    cached = [None] * (frames + 1)
 
     def get_data(frame):
         cache = cached[frame]
         if cache is not None:
             return cache
 
+        if trajectory:
+            cached[frame] = [list(coords) for coords in trajectory.pose(frame)]
+            return cached[frame]
+
         remove = (max_shock_diff * (frame / frames))
         bike.shock.constrain_length(bike.shock_starting_length - remove)
 
@@ -742,17 +2639,7 @@ def draw(bike):
         return cached[frame]
 
     plot = ax.plot(*get_data(0), 'o')[0]
-
-    min_x = min(j.x for j in bike.joints.values())
-    max_x = max(j.x for j in bike.joints.values())
-    min_y = min(j.y for j in bike.joints.values())
-    max_y = max(j.y for j in bike.joints.values())
-    padding_x = (0.2 * (max_x - min_x));
-    padding_y = (0.4 * (max_y - min_y));
-
-    ax.set_xlim([min_x - padding_x, max_x + padding_x])
-    ax.set_ylim([min_y - padding_y, max_y + padding_y])
-    ax.set_aspect(1)
+    _frame(ax, bike)
 
     def update(frame):
         plot.set_data(*get_data(frame))
@@ -761,88 +2648,465 @@ def draw(bike):
     plt.show()
 
 
-def leverage_curve(bike, draw=False):
-    travel, eye2eye, stroke = bike.travel, bike.eye2eye, bike.stroke
+def export(bike, path, trajectory=None, fps=30, strip=11):
+    """
+    draw, but without a display: the whole sweep is solved up front (or read
+    from trajectory) and rendered with the Agg backend to path. The format
+    goes by the extension:
+
+    .gif  animation, back and forth through the travel like draw
+    .mp4  the same, needs ffmpeg
+    .png  one image per step, numbered path-000.png, path-001.png...
+    .svg  strip frames side by side, rest to full compression
+    """
+
+    stem, ext = os.path.splitext(path)
+    assert ext in ('.gif', '.mp4', '.png', '.svg'), f'unknown format {ext}'
+    # the first and last frames are rest and full compression
+    assert strip >= 2, 'strip needs at least 2 frames'
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+
+    if trajectory is None:
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            trajectory = Trajectory.record(
+                bike, os.path.join(tmp, 'sweep.traj'), continuation=True,
+            )
+
+            try:
+                bike.platform.set_pose(trajectory.pose(0))
+                export(bike, path, trajectory, fps, strip)
+            finally:
+                trajectory.close()
+
+            return
+
+    steps = trajectory.steps
+    poses = [[list(coords) for coords in trajectory.pose(i)] for i in range(steps + 1)]
+
+    if ext == '.svg':
+        fig, axes = plt.subplots(1, strip, figsize=(3 * strip, 3))
+
+        for n, ax in enumerate(axes):
+            ax.plot(*poses[round(n * steps / (strip - 1))], 'o')
+            _frame(ax, bike)
+            ax.set_axis_off()
+
+        fig.savefig(path)
+        plt.close(fig)
+        return
+
+    fig, ax = plt.subplots()
+    plot = ax.plot(*poses[0], 'o')[0]
+    _frame(ax, bike)
+
+    if ext == '.png':
+        for i, pose in enumerate(poses):
+            plot.set_data(*pose)
+            fig.savefig(f'{stem}-{i:03}.png')
+
+        plt.close(fig)
+        return
+
+    all_frames = list(range(steps + 1)) + list(range(steps - 1, 0, -1))
+
+    def update(frame):
+        plot.set_data(*poses[frame])
+
+    ani = animation.FuncAnimation(fig=fig, func=update, frames=all_frames)
+
+    if ext == '.gif':
+        writer = animation.PillowWriter(fps=fps)
+    else:
+        writer = animation.FFMpegWriter(fps=fps)
+
+    ani.save(path, writer=writer)
+    plt.close(fig)
+
+
+def _shock_travel(bike):
+    """
+    How much shorter the shock gets over its stroke, in datasheet units
+    """
 
     max_percent = bike.stroke / bike.eye2eye
     ending_length = bike.shock_starting_length * (1 - max_percent)
-    max_shock_diff = bike.shock_starting_length - ending_length
+    return bike.shock_starting_length - ending_length
 
-    prev_shock_length = bike.shock_starting_length
-    prev_axle = Joint(bike.joints['axle'].x, bike.joints['axle'].y, 'prev')
-    starting_axle = Joint(bike.joints['axle'].x, bike.joints['axle'].y, 'prev')
-    x_data = []
-    y_data = []
 
+def _instant_leverage(bike):
+    """
+    d(axle y)/d(shock length) at the current pose, see Platform.velocities
+    """
+
+    # the shock shadow follows the shock length for length
+    rates = {bike.shock: 1}
+    if bike.shock_shadow:
+        rates[bike.shock_shadow] = 1
+
+    return abs(bike.platform.velocities(rates)[bike.joints['axle']][1])
+
+
+def sweep(bike, steps=100, continuation=False, stats=None, trajectory=None):
+    """
+    Compress the shock through its stroke, yielding how much it has been
+    shortened by with the bike at each solved pose, the rest pose first.
+
+    The stroke is split into steps equal pieces, unless the caller sends
+    the amount to shorten it by next instead. Sending an amount no more than
+    the one just yielded throws that pose away and solves from the one
+    before it, which is how an adaptive caller backs out of a step.
+
+    With continuation, each solve starts from a pose predicted from the
+    tangent of the last two solved poses rather than from the last pose
+    itself, which leaves the solver only a few iterations of correcting to
+    do. Pass a SweepStats as stats to collect the SolveStats of every solve.
+    Given a Trajectory of the bike, the poses are read from it rather than
+    solved, and the steps are the trajectory's.
+    """
+
+    max_shock_diff = _shock_travel(bike)
+
+    if trajectory:
+        steps = trajectory.steps
+
+    # hold the shock at rest too, so the rest pose has velocities
+    bike.shock.constrain_length(bike.shock_starting_length)
+    if bike.shock_shadow:
+        bike.shock_shadow.constrain_length(bike.shock_shadow_starting_length)
+
+    # (amount removed, pose) of the last solves, for the predictor and for
+    # backing out of a rejected step
+    solved = [(0, bike.platform.pose())]
+    requested = yield 0
     i = 1
-    steps = 100
-    while i <= steps:
-        remove = (max_shock_diff * (i/steps))
+    iterations = 0
+
+    while True:
+        if requested is None:
+            if i > steps:
+                if trajectory:
+                    log.info('sweep: %d poses read from %s', steps, trajectory.file)
+                else:
+                    log.info(
+                        'sweep: %d poses, %d solver iterations (%s)',
+                        steps, iterations, bike.platform.engine,
+                    )
+                return
+            remove = max_shock_diff * (i / steps)
+        else:
+            assert not trajectory, 'a trajectory has fixed steps'
+            remove = requested
+
+        if len(solved) > 1 and remove <= solved[-1][0]:
+            solved.pop()
+            bike.platform.set_pose(solved[-1][1])
+
         bike.shock.constrain_length(bike.shock_starting_length - remove)
 
         if bike.shock_shadow:
             bike.shock_shadow.constrain_length(bike.shock_shadow_starting_length - remove)
 
-        bike.platform.solve()
+        if continuation and len(solved) > 1:
+            (prev_remove, prev_pose), (last_remove, last_pose) = solved[-2:]
+            ratio = (remove - last_remove) / (last_remove - prev_remove)
+            bike.platform.extrapolate(prev_pose, last_pose, ratio)
+
+        if trajectory:
+            bike.platform.set_pose(trajectory.pose(i))
+        else:
+            with phase('kinematic solve'):
+                solve_stats = bike.platform.solve(stats=True)
+
+            iterations += solve_stats.iterations
+            log.debug(
+                'step %d: shock -%g, %d iterations',
+                i, remove, solve_stats.iterations,
+            )
+
+            if stats is not None:
+                stats.add(solve_stats)
+
+        solved = solved[-2:] + [(remove, bike.platform.pose())]
+        requested = yield remove
+        i += 1
+
 
-        delta_shock = bike.shock.current_length - prev_shock_length
+class Leverage:
+    """
+    Sweep accumulator for the leverage curve, as leverage_curve returns it.
+
+    By default the leverage is the change in axle height over the change in
+    shock length between consecutive poses, so it is the average over each
+    step. With analytic, it is the exact, instantaneous d(axle y)/d(shock
+    length) at each pose (see Platform.velocities), which needs far fewer
+    poses for the same accuracy. The curve then starts at the rest pose.
+    """
+
+    def __init__(self, bike, analytic=False):
+        self.bike = bike
+        self.analytic = analytic
+        self.x_data = []
+        self.y_data = []
+        # where along the shock travel each sample applies
+        self.middles = []
+        self.start = None
+
+    def sample(self, remove):
+        """
+        (axle travel, leverage, where it applies) at the current pose, without
+        adding it to the curve
+        """
+
+        axle = self.bike.joints['axle']
+
+        if self.analytic:
+            return axle.y - self.start, _instant_leverage(self.bike), remove
 
         # we don't actually want to do the full delta of the axle, but rather
         # just the delta y ... because when companies say "160mm travel" they
-        # really mean "160mm *vertical* travel" ... not "the wheel travels 160mm"
-        #
-        # this is what "the wheel travels 160mm" would look like
-        # delta_axle = Joint.dist(bike.joints['axle'], prev_axle)
-        # delta_axle_total = Joint.dist(bike.joints['axle'], starting_axle)
+        # really mean "160mm *vertical* travel" ... not "the wheel travels
+        # 160mm", which would be Joint.dist(axle, prev_axle)
+        delta_axle = axle.y - self.prev_axle_y
+        delta_shock = self.bike.shock.current_length - self.prev_shock_length
 
-        # and this is "160mm *vertical* travel
-        delta_axle = bike.joints['axle'].y - prev_axle.y
-        delta_axle_total = bike.joints['axle'].y - starting_axle.y
+        # each sample is the average leverage over its step, so it sits at
+        # the middle of it
+        middle = (self.removed + remove) / 2
 
-        leverage = abs(delta_axle / delta_shock)
-        
-        print(i, leverage)
+        return axle.y - self.start, abs(delta_axle / delta_shock), middle
 
-        x_data.append(delta_axle_total)
-        y_data.append(leverage)
+    def add(self, remove, sample=None):
+        axle = self.bike.joints['axle']
+        rest = self.start is None
 
-        prev_shock_length = bike.shock.current_length
-        prev_axle = Joint(bike.joints['axle'].x, bike.joints['axle'].y, 'prev')
+        if rest:
+            self.start = axle.y
 
-        # TODO: make more precise
-        i += 1
+        # the rest pose only has a leverage of its own when it is exact
+        if self.analytic or not rest:
+            x, leverage, middle = sample or self.sample(remove)
+            log.debug('leverage %d: %g at %g', len(self.y_data), leverage, x)
+            self.x_data.append(x)
+            self.y_data.append(leverage)
+            self.middles.append(middle)
 
-    # convert x axis to wheel travel scale
-    x_data = [x/x_data[-1]*travel for x in x_data]
+        self.removed = remove
+        self.prev_axle_y = axle.y
+        self.prev_shock_length = self.bike.shock.current_length
 
-    # do error correction based on the area under the reciprocal (integral) and
-    # edge it towards the correct solution
+    def result(self):
+        travel, stroke = self.bike.travel, self.bike.stroke
 
-    y_recip = [1/y for y in y_data]
-    x_deltas = [d[1] - d[0] for d in zip(x_data[:-1], x_data[1:])]
-    area = sum(d[0]*d[1] for d in zip(x_deltas, y_recip))
-    error = (area - stroke) / stroke
-    og_error = error
-    corrections = 0
-    print('applying error correction...')
-
-    while abs(error) > 1e-5 and corrections < 10_000:
-        y_min = min(y_data)
-        adjustment = y_min * 1e-5
-
-        if error < 0:
-            y_data = [d - adjustment for d in y_data]
-        else:
-            y_data = [d + adjustment for d in y_data]
+        # convert x axis to wheel travel scale
+        x_data = [x/self.x_data[-1]*travel for x in self.x_data]
+
+        # do error correction: the area under the reciprocal (integral)
+        # should be the stroke
+        y_data = normalize_stroke(x_data, self.y_data, stroke)
+
+        return x_data, y_data
+
+
+class AxlePath:
+    """
+    Sweep accumulator for where the axle goes, as (x, y) in mm from where it
+    is at rest
+    """
+
+    def __init__(self, bike):
+        self.bike = bike
+        self.path = []
+
+    def add(self, remove):
+        axle = self.bike.joints['axle']
+        self.path.append((axle.x, axle.y))
+
+    def result(self):
+        (x0, y0), (_, y1) = self.path[0], self.path[-1]
+        scale = self.bike.travel / (y1 - y0)
+
+        return [((x - x0) * scale, (y - y0) * scale) for x, y in self.path]
+
+
+class InstantCentre:
+    """
+    Sweep accumulator for the instant centre of the part carrying the axle,
+    as (x, y) in mm from the axle at rest, (nan, nan) while it is at
+    infinity. The part is taken to be the first link on the axle other than
+    the shock: it turns about the point where the lines square to the
+    velocities of its two ends meet.
+    """
+
+    def __init__(self, bike):
+        self.bike = bike
+        self.centres = []
+        self.axle_xs = []
+        self.axle_ys = []
+
+        axle = bike.joints['axle']
+        self.link = next(
+            link for link in bike.platform.linkages.values()
+            if axle in (link.j1, link.j2) and link is not bike.shock
+        )
+        self.other = self.link.j2 if self.link.j1 is axle else self.link.j1
+
+    def add(self, remove):
+        bike = self.bike
+        axle, other = bike.joints['axle'], self.other
+
+        rates = {bike.shock: 1}
+        if bike.shock_shadow:
+            rates[bike.shock_shadow] = 1
+
+        velocities = bike.platform.velocities(rates)
+        (avx, avy), (ovx, ovy) = velocities[axle], velocities[other]
+        self.axle_xs.append(axle.x)
+        self.axle_ys.append(axle.y)
+
+        # a pivot that doesn't move is the centre
+        if math.hypot(ovx, ovy) < 1e-9 * math.hypot(avx, avy):
+            self.centres.append((other.x, other.y))
+            return
+
+        # axle + s (-avy, avx) = other + t (-ovy, ovx)
+        cross = avy * ovx - avx * ovy
+        if abs(cross) < 1e-12:
+            self.centres.append((math.nan, math.nan))
+            return
+
+        dx, dy = other.x - axle.x, other.y - axle.y
+        s = -(dy * ovy + dx * ovx) / cross
+        self.centres.append((axle.x - s * avy, axle.y + s * avx))
+
+    def result(self):
+        x0, y0 = self.axle_xs[0], self.axle_ys[0]
+        scale = self.bike.travel / (self.axle_ys[-1] - y0)
+
+        return [((x - x0) * scale, (y - y0) * scale) for x, y in self.centres]
+
+
+class Progression:
+    """
+    Sweep accumulator for the progression, how much the leverage falls from
+    the start of the travel to the end, as a percentage of the start
+    """
+
+    def __init__(self, bike):
+        self.leverage = Leverage(bike)
+
+    def add(self, remove):
+        self.leverage.add(remove)
+
+    def result(self):
+        y_data = self.leverage.result()[1]
+        return (y_data[0] - y_data[-1]) / y_data[0] * 100
+
+
+class VelocityRatio:
+    """
+    Sweep accumulator for how fast the shock moves for the speed of the
+    wheel at each pose (the reciprocal of the instant leverage), as
+    (wheel travel, ratio) lists
+    """
+
+    def __init__(self, bike):
+        self.bike = bike
+        self.axle_ys = []
+        self.ratios = []
+
+    def add(self, remove):
+        self.axle_ys.append(self.bike.joints['axle'].y)
+        self.ratios.append(1 / _instant_leverage(self.bike))
+
+    def result(self):
+        y0, y1 = self.axle_ys[0], self.axle_ys[-1]
+        x_data = [(y - y0) / (y1 - y0) * self.bike.travel for y in self.axle_ys]
+
+        return x_data, self.ratios
+
+
+def measure(bike, metrics, steps=100, continuation=False, stats=None, trajectory=None):
+    """
+    Feed every pose of one sweep (see sweep) to each of metrics, sweep
+    accumulators like Leverage or AxlePath, and return their results
+    """
 
-        y_recip = [1/y for y in y_data]
-        x_deltas = [d[1] - d[0] for d in zip(x_data[:-1], x_data[1:])]
-        area = sum(d[0]*d[1] for d in zip(x_deltas, y_recip))
-        error = (area - stroke) / stroke
-        corrections += 1
+    for remove in sweep(bike, steps, continuation, stats, trajectory):
+        for metric in metrics:
+            metric.add(remove)
 
-    print('original error: ', og_error)
-    print(f'new error ({corrections} corrections): ', error)
+    return [metric.result() for metric in metrics]
+
+
+def leverage_curve(bike,
+                   draw=False,
+                   continuation=False,
+                   stats=None,
+                   steps=100,
+                   accuracy=None,
+                   analytic=False,
+                   trajectory=None,
+                  ):
+    """
+    Compress the shock through its stroke and sample the leverage along the
+    way, see Leverage and sweep.
+
+    By default the stroke is split into steps equal pieces. Given an accuracy
+    instead, the step size adapts: a step is halved and retried while its
+    leverage strays more than accuracy from the line through the previous
+    samples, and grows again where the curve is close to straight, so the
+    samples bunch up where the curve bends.
+    """
+
+    curve = Leverage(bike, analytic)
+    poses = sweep(bike, steps, continuation, stats, trajectory)
+    curve.add(next(poses))
+
+    if accuracy is None:
+        for remove in poses:
+            curve.add(remove)
+    else:
+        # adaptive step sizes, as fractions of the shock travel
+        max_shock_diff = _shock_travel(bike)
+        step = max_shock_diff / 100
+        min_step = max_shock_diff / 1000
+        max_step = max_shock_diff / 10
+        removed = 0
+
+        while removed < max_shock_diff:
+            remove = poses.send(min(removed + step, max_shock_diff))
+            sample = curve.sample(remove)
+            _, leverage, middle = sample
+            y_data, middles = curve.y_data, curve.middles
+
+            if y_data:
+                # compare against a straight line through the last two
+                # samples, which is all a linear interpolation of the curve
+                # gives us anyway
+                predicted = y_data[-1]
+
+                if len(y_data) > 1:
+                    slope = (y_data[-1] - y_data[-2]) / (middles[-1] - middles[-2])
+                    predicted += slope * (middle - middles[-1])
+
+                error = abs(leverage - predicted)
+
+                if error > accuracy and step > min_step:
+                    step = max(step / 2, min_step)
+                    continue
+
+                if error < accuracy / 4:
+                    step = min(step * 2, max_step)
+
+            curve.add(remove, sample)
+            removed = remove
+
+    x_data, y_data = curve.result()
 
     if not draw:
         return x_data, y_data
@@ -853,33 +3117,151 @@ def leverage_curve(bike, draw=False):
     plt.show()
 
 
-def quantized_leverage_curve(bike, draw=False, resolution=6, normalized=False):
-    assert resolution >= 2, 'resolution must be 2 or greater'
+@phase('stroke correction')
+def normalize_stroke(x_data, y_data, stroke):
+    """
+    Offset every leverage in y_data by the same amount so that the area under
+    the reciprocal, the shock travel the curve implies, comes out at stroke.
+
+    The area only shrinks as the offset grows, so the offset is a single
+    root: Newton's method, falling back to bisection whenever a step would
+    leave the bracket around it.
+    """
+
+    x_deltas = [d[1] - d[0] for d in zip(x_data[:-1], x_data[1:])]
+    weighted = list(zip(x_deltas, y_data))
+
+    def area(offset):
+        return sum(dx / (y + offset) for dx, y in weighted)
 
-    raw_x_data, raw_y_data = leverage_curve(bike)
-    travel, stroke = bike.travel, bike.stroke
+    # the area blows up as the smallest leverage nears 0, and is under the
+    # stroke once that leverage alone would cover the whole travel
+    y_min = min(y for dx, y in weighted)
+    lo = -y_min
+    hi = max(0, sum(x_deltas) / stroke - y_min)
 
-    deltas = raw_x_data[-1] / (resolution-1)
-    x_data = [x*deltas for x in range(0, resolution)]
+    og_error = (area(0) - stroke) / stroke
+    error = og_error
+    offset = 0
+    iterations = 0
 
-    # need to find the closest data points we have to our desired x_data
-    y_data = []
-    for i in range(resolution):
-        x = x_data[i]
-        closest_i = None
-        closest_i_dist = float('inf')
+    while abs(error) > 1e-12 and iterations < 100:
+        if error > 0:
+            lo = offset
+        else:
+            hi = offset
+
+        slope = -sum(dx / (y + offset) ** 2 for dx, y in weighted)
+        offset -= error * stroke / slope
 
-        for i, raw_x in enumerate(raw_x_data):
-            dist = abs(raw_x - x)
-            if dist < closest_i_dist:
-                closest_i_dist = dist
-                closest_i = i
+        if not lo < offset < hi:
+            offset = (lo + hi) / 2
 
-        y_data.append(raw_y_data[closest_i])
+        error = (area(offset) - stroke) / stroke
+        iterations += 1
+
+    log.debug(
+        'stroke correction: error %g -> %g in %d iterations',
+        og_error, error, iterations,
+    )
+
+    return [y + offset for y in y_data]
+
+
+def normalize_strokes(curves):
+    """
+    normalize_stroke for a batch of (x_data, y_data, stroke) curves, e.g.
+    when regenerating every bike. Returns the corrected y_data of each.
+    """
+
+    return [normalize_stroke(x, y, stroke) for x, y, stroke in curves]
+
+
+def resample(x_data, y_data, xs, monotone=False):
+    """
+    The curve through (x_data, y_data), x_data sorted, at each of xs.
+    Linear between samples, or with monotone a monotone cubic
+    (Fritsch-Carlson) that doesn't overshoot the samples either side. Beyond
+    the ends the curve holds the end values.
+    """
+
+    n = len(x_data)
+    slopes = [
+        (y_data[i+1] - y_data[i]) / (x_data[i+1] - x_data[i])
+        for i in range(n - 1)
+    ]
+
+    if monotone and n > 2:
+        tangents = [slopes[0]] + [
+            0 if a * b <= 0 else (a + b) / 2
+            for a, b in zip(slopes[:-1], slopes[1:])
+        ] + [slopes[-1]]
+
+        # rein in tangents that would take a piece past its ends
+        for i, slope in enumerate(slopes):
+            if slope == 0:
+                tangents[i] = tangents[i+1] = 0
+                continue
+
+            a, b = tangents[i] / slope, tangents[i+1] / slope
+            h = math.hypot(a, b)
+            if h > 3:
+                tangents[i] = 3 / h * a * slope
+                tangents[i+1] = 3 / h * b * slope
+
+    ys = []
+    for x in xs:
+        if x <= x_data[0]:
+            ys.append(y_data[0])
+            continue
+        if x >= x_data[-1]:
+            ys.append(y_data[-1])
+            continue
+
+        i = bisect.bisect_right(x_data, x) - 1
+        dx = x_data[i+1] - x_data[i]
+        t = (x - x_data[i]) / dx
+
+        if not monotone or n <= 2:
+            ys.append(y_data[i] + slopes[i] * (x - x_data[i]))
+            continue
+
+        # cubic hermite
+        t2, t3 = t * t, t * t * t
+        ys.append(
+            (2*t3 - 3*t2 + 1) * y_data[i] +
+            (t3 - 2*t2 + t) * dx * tangents[i] +
+            (-2*t3 + 3*t2) * y_data[i+1] +
+            (t3 - t2) * dx * tangents[i+1]
+        )
+
+    return ys
+
+
+@phase('quantization')
+def quantize(x_data,
+             y_data,
+             travel,
+             stroke,
+             resolution=6,
+             normalized=False,
+             monotone=False,
+            ):
+    """
+    Resample a raw leverage_curve to resolution evenly spaced points across
+    the travel, then correct it so the area under the reciprocal is stroke
+    again. Cheap, so any resolution can be had from one sweep.
+    """
+
+    assert resolution >= 2, 'resolution must be 2 or greater'
+
+    deltas = x_data[-1] / (resolution-1)
+    quantized_x = [x*deltas for x in range(0, resolution)]
+    quantized_y = resample(x_data, y_data, quantized_x, monotone=monotone)
 
     # do error correction
     # area under recip should be stroke
-    recip_y = [1/y for y in y_data]
+    recip_y = [1/y for y in quantized_y]
     area = sum([
         ((recip_y[i]*deltas)+(recip_y[i+1]*deltas))/2
         for i in range(resolution-1)
@@ -888,11 +3270,81 @@ def quantized_leverage_curve(bike, draw=False, resolution=6, normalized=False):
     change = diff / (resolution-1) / deltas
 
     recip_y = [y+change for y in recip_y]
-    y_data = [1/y for y in recip_y]
+    quantized_y = [1/y for y in recip_y]
 
     if normalized:
         leverage = travel / stroke
-        y_data = [y / leverage for y in y_data]
+        quantized_y = [y / leverage for y in quantized_y]
+
+    return quantized_x, quantized_y
+
+
+def quantized_leverage_curves(bike,
+                              resolutions=(6, 11, 21, 101),
+                              normalized=False,
+                              continuation=False,
+                              stats=None,
+                              steps=100,
+                              accuracy=None,
+                              analytic=False,
+                              monotone=False,
+                              trajectory=None,
+                             ):
+    """
+    {resolution: (x_data, y_data)} for each of resolutions, all quantized
+    from the one leverage_curve sweep.
+    """
+
+    raw_x_data, raw_y_data = leverage_curve(
+        bike,
+        continuation=continuation,
+        stats=stats,
+        steps=steps,
+        accuracy=accuracy,
+        analytic=analytic,
+        trajectory=trajectory,
+    )
+
+    return {
+        resolution: quantize(
+            raw_x_data,
+            raw_y_data,
+            bike.travel,
+            bike.stroke,
+            resolution=resolution,
+            normalized=normalized,
+            monotone=monotone,
+        )
+        for resolution in resolutions
+    }
+
+
+def quantized_leverage_curve(bike,
+                             draw=False,
+                             resolution=6,
+                             normalized=False,
+                             continuation=False,
+                             stats=None,
+                             steps=100,
+                             accuracy=None,
+                             analytic=False,
+                             monotone=False,
+                             trajectory=None,
+                            ):
+    assert resolution >= 2, 'resolution must be 2 or greater'
+
+    x_data, y_data = quantized_leverage_curves(
+        bike,
+        resolutions=(resolution,),
+        normalized=normalized,
+        continuation=continuation,
+        stats=stats,
+        steps=steps,
+        accuracy=accuracy,
+        analytic=analytic,
+        monotone=monotone,
+        trajectory=trajectory,
+    )[resolution]
 
     if not draw:
         return x_data, y_data
@@ -903,6 +3355,289 @@ def quantized_leverage_curve(bike, draw=False, resolution=6, normalized=False):
     plt.show()
 
 
+def tune_solver(load,
+                max_error=0.005,
+                steps=(10, 20, 25, 50, 100, 200, 400),
+                tolerances=(1e-3, 1e-4, 1e-5, 1e-6, 1e-9),
+                resolution=6,
+               ):
+    """
+    Find the cheapest steps and solve tolerance that keep the normalized,
+    quantized curve of a bike within max_error of a reference solved with
+    1000 steps to 1e-10. load makes a fresh bike (at rest) each time.
+
+    Cost is the total solver iterations of the sweep, which unlike wall time
+    is the same run to run. Returns the pick (or None if nothing is good
+    enough) and every (steps, tolerance, iterations, seconds, error) tried.
+
+    The dyads engine solves in closed form, one iteration whatever the
+    tolerance, so for bikes on it only steps are tried (tolerance None).
+    """
+
+    if load().platform.engine == 'dyads':
+        tolerances = (None,)
+
+    def curve(steps, tolerance):
+        bike = load()
+        bike.platform.tolerance = tolerance
+        stats = SweepStats()
+        start = time.perf_counter()
+        y_data = quantized_leverage_curve(
+            bike,
+            resolution=resolution,
+            normalized=True,
+            stats=stats,
+            steps=steps,
+        )[1]
+
+        return sum(stats.iterations), time.perf_counter() - start, y_data
+
+    reference = curve(1000, 1e-10)[2]
+    trials = []
+
+    for step_count in steps:
+        for tolerance in tolerances:
+            iterations, seconds, y_data = curve(step_count, tolerance)
+            error = max(abs(a - b) for a, b in zip(y_data, reference))
+            trials.append((step_count, tolerance, iterations, seconds, error))
+
+    good = [trial for trial in trials if trial[4] <= max_error]
+
+    # among equally cheap settings, the tighter tolerance and more steps
+    pick = min(
+        good,
+        key=lambda trial: (trial[2], trial[1] or 0, -trial[0]),
+        default=None,
+    )
+
+    return pick, trials
+
+
+def shock_leverage_curves(bike, shocks, steps=400, samples=100):
+    """
+    leverage_curve for each of shocks, (eye2eye, stroke) pairs in mm, from a
+    single sweep of the kinematics. The shock is first pulled out to the
+    longest eye to eye asked for, then pushed in to the shortest compressed
+    length, recording the axle height over steps solves. Each shock's curve
+    is read back off that at samples points across its own stroke, its
+    travel scaled from the datasheet's by how far the axle moves.
+
+    Returns {(eye2eye, stroke): (x_data, y_data)} shaped like leverage_curve
+    (normalized to the stroke, x_data ending at the travel), and leaves the
+    bike at rest.
+    """
+
+    rest = bike.platform.pose()
+
+    # datasheet pixels per mm, going by the shock the bike was drawn with
+    scale = bike.shock_starting_length / bike.eye2eye
+    shocks = list(shocks)
+    sizes = shocks + [(bike.eye2eye, bike.stroke)]
+    longest = max(e2e for e2e, _ in sizes) * scale
+    shortest = min(e2e - stroke for e2e, stroke in sizes) * scale
+    step = (longest - shortest) / steps
+
+    def set_length(length):
+        bike.shock.constrain_length(length)
+        if bike.shock_shadow:
+            bike.shock_shadow.constrain_length(
+                bike.shock_shadow_starting_length - bike.shock_starting_length + length
+            )
+
+    length = bike.shock_starting_length
+    while length < longest:
+        length = min(length + step, longest)
+        set_length(length)
+        bike.platform.solve()
+
+    shock_lengths = []
+    axle_ys = []
+
+    for i in range(steps + 1):
+        set_length(longest - step * i)
+        bike.platform.solve()
+        shock_lengths.append(bike.shock.current_length)
+        axle_ys.append(bike.joints['axle'].y)
+
+    set_length(bike.shock_starting_length)
+    bike.platform.set_pose(rest)
+
+    # ascending shock lengths, for resample
+    shock_lengths.reverse()
+    axle_ys.reverse()
+
+    def axle_path(e2e, stroke):
+        rest = e2e * scale
+        lengths = [rest - stroke * scale * i / samples for i in range(samples + 1)]
+        return lengths, resample(shock_lengths, axle_ys, lengths, monotone=True)
+
+    stock_lengths, stock_ys = axle_path(bike.eye2eye, bike.stroke)
+    stock_travel = stock_ys[-1] - stock_ys[0]
+    curves = {}
+
+    for e2e, stroke in shocks:
+        lengths, ys = axle_path(e2e, stroke)
+        travel = bike.travel * (ys[-1] - ys[0]) / stock_travel
+
+        x_data = [(y - ys[0]) / (ys[-1] - ys[0]) * travel for y in ys[1:]]
+        y_data = [
+            abs((ys[i+1] - ys[i]) / (lengths[i+1] - lengths[i]))
+            for i in range(samples)
+        ]
+
+        curves[(e2e, stroke)] = x_data, normalize_stroke(x_data, y_data, stroke)
+
+    return curves
+
+
+class LeverageBand:
+    """
+    The spread of a leverage curve over many samples: the mean and the
+    low/high bounds of the confidence interval at each x
+    """
+
+    def __init__(self, x_data, curves, confidence):
+        self.x = x_data
+        self.mean = []
+        self.low = []
+        self.high = []
+
+        for ys in zip(*curves):
+            ys = sorted(ys)
+            tail = (1 - confidence) / 2
+            self.mean.append(sum(ys) / len(ys))
+            self.low.append(ys[int(tail * (len(ys) - 1))])
+            self.high.append(ys[math.ceil((1 - tail) * (len(ys) - 1))])
+
+
+def leverage_uncertainty(bike,
+                         samples=1000,
+                         sigma=2,
+                         resolution=6,
+                         steps=100,
+                         confidence=0.95,
+                         seed=None,
+                        ):
+    """
+    How much the normalized leverage curve of bike moves when every joint is
+    off by a few pixels, as it will be having been clicked on a photo. Each
+    joint coordinate gets gaussian noise of sigma, samples times over, and
+    every sample is swept through the stroke like leverage_curve does.
+
+    The samples are solved together, CompiledPlatform.solve_dyads_batch
+    placing each joint in every sample before moving on to the next, and
+    only bikes that don't break down into dyads solve sample by sample.
+
+    Returns (LeverageBand of the curve quantized at resolution, LeverageBand
+    of the curve at 101 points, how many samples couldn't be solved).
+    """
+
+    import random
+
+    rng = random.Random(seed)
+    platform = bike.platform
+    bike.shock.constrain_length(bike.shock_starting_length)
+    if bike.shock_shadow:
+        bike.shock_shadow.constrain_length(bike.shock_shadow_starting_length)
+
+    compiled = platform.compile()
+    plan = platform.plan()
+    joints = range(len(compiled.joints))
+    shock = compiled.linkages.index(bike.shock)
+    shadow = compiled.linkages.index(bike.shock_shadow) \
+        if bike.shock_shadow else None
+    axle = compiled.joints.index(bike.joints['axle'])
+
+    # solving sample by sample goes through the bike's own arrays, put back
+    # after
+    rest = array('d', compiled.xs), array('d', compiled.ys), array('d', compiled.lengths)
+
+    xs = [array('d', [compiled.xs[j] + rng.gauss(0, sigma) for _ in range(samples)]) for j in joints]
+    ys = [array('d', [compiled.ys[j] + rng.gauss(0, sigma) for _ in range(samples)]) for j in joints]
+
+    # every link keeps the length it has in its sample
+    lengths = {}
+    for k in compiled.constrained:
+        a, b = compiled.j1[k], compiled.j2[k]
+        lengths[k] = array('d', [
+            math.hypot(xs[b][s] - xs[a][s], ys[b][s] - ys[a][s])
+            for s in range(samples)
+        ])
+
+    shock_start = array('d', lengths[shock])
+    shadow_start = array('d', lengths[shadow]) if shadow is not None else None
+    shock_diff = [length * bike.stroke / bike.eye2eye for length in shock_start]
+    axle_ys = [array('d', ys[axle])]
+
+    for i in range(1, steps + 1):
+        for s in range(samples):
+            remove = shock_diff[s] * (i / steps)
+            lengths[shock][s] = shock_start[s] - remove
+
+            if shadow is not None:
+                lengths[shadow][s] = shadow_start[s] - remove
+
+        if plan is not None:
+            start = [array('d', x) for x in xs], [array('d', y) for y in ys]
+            compiled.solve_dyads_batch(plan, xs, ys, lengths, start)
+        else:
+            for s in range(samples):
+                compiled.xs[:] = array('d', [x[s] for x in xs])
+                compiled.ys[:] = array('d', [y[s] for y in ys])
+                for k, length in lengths.items():
+                    compiled.lengths[k] = length[s]
+
+                try:
+                    platform.solve()
+                except AssertionError:
+                    compiled.xs[:] = array('d', [math.nan] * len(joints))
+                    compiled.ys[:] = array('d', [math.nan] * len(joints))
+
+                for j in joints:
+                    xs[j][s], ys[j][s] = compiled.xs[j], compiled.ys[j]
+
+        axle_ys.append(array('d', ys[axle]))
+
+    compiled.xs[:], compiled.ys[:], compiled.lengths[:] = rest
+
+    quantized = []
+    curves = []
+    failed = 0
+    leverage = bike.travel / bike.stroke
+    grid = [bike.travel * i / 100 for i in range(101)]
+
+    for s in range(samples):
+        ys = [step[s] for step in axle_ys]
+        delta_shock = shock_diff[s] / steps
+
+        # unsolvable, or jammed into running the axle backwards
+        if any(not b > a for a, b in zip(ys[:-1], ys[1:])):
+            failed += 1
+            continue
+
+        x_data = [y - ys[0] for y in ys[1:]]
+        y_data = [abs((b - a) / delta_shock) for a, b in zip(ys[:-1], ys[1:])]
+        x_data = [x / x_data[-1] * bike.travel for x in x_data]
+
+        y_data = normalize_stroke(x_data, y_data, bike.stroke)
+
+        quantized.append(quantize(
+            x_data, y_data, bike.travel, bike.stroke,
+            resolution=resolution, normalized=True,
+        )[1])
+        curves.append([y / leverage for y in resample(x_data, y_data, grid)])
+
+    assert quantized, 'no sample could be solved'
+
+    quantized_x = [bike.travel * i / (resolution - 1) for i in range(resolution)]
+
+    return (
+        LeverageBand(quantized_x, quantized, confidence),
+        LeverageBand(grid, curves, confidence),
+        failed,
+    )
+
+
 if __name__ == '__main__':
     # unittest.main()
     draw(patrol())
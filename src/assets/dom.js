@@ -74,23 +74,56 @@ config.addChangeCallback(calculateSag, {dataKey: 'sagPercentage', runInitial: tr
 
 // the bike search
 
+// the bikes and their search index, fetched the first time they are needed
+let bikesData = null;
+let bikesDataRequest = null;
+
+function loadBikesData() {
+  if (!bikesDataRequest) {
+    const src = document.getElementById('bikes-data').getAttribute('src');
+
+    bikesDataRequest = fetch(src)
+      .then(response => response.json())
+      .then(data => bikesData = data)
+      .catch(error => {
+        // try again next time
+        bikesDataRequest = null;
+        throw error;
+      });
+  }
+
+  return bikesDataRequest;
+}
+
 const searchInput = document.querySelector('input[type="search"]');
 const searchResults = document.getElementById('search-results');
 
-function gatherBikesIds(term, trie) {
-  if (!trie) return [];
+// nodes of the radix tree are [edge, ids, children by first edge character]
+function gatherBikesIds(term, node) {
+  if (!node) return [];
+
+  const [edge, ids, children = {}] = node;
 
-  if (term.length === 0) {
+  // the term ends along this edge, everything below matches
+  if (edge.startsWith(term)) {
     return [
-      ...trie.object_ids,
-      ...Object.values(trie.children).map(t => gatherBikesIds('', t)).flat()
+      ...ids,
+      ...Object.values(children).map(n => gatherBikesIds('', n)).flat()
     ];
   }
 
-  return gatherBikesIds(term.slice(1), trie.children[term[0]]);
+  if (!term.startsWith(edge)) return [];
+
+  const rest = term.slice(edge.length);
+  return gatherBikesIds(rest, children[rest[0]]);
 }
 
 function updateResults() {
+  if (!bikesData) {
+    loadBikesData().then(updateResults);
+    return;
+  }
+
   searchResults.style.display = 'block';
   searchResults.innerHTML = '';
   const val = searchInput.value;
@@ -212,9 +245,11 @@ function selectBikeByElement(el) {
 
 const initialBikeId = (new URLSearchParams(window.location.search)).get('bike');
 if (!!initialBikeId) {
-  const bikeIdx = bikesData.ids[initialBikeId];
-  const bike = bikesData.bikes[bikeIdx];
-  if (bike) selectBike(bike);
+  loadBikesData().then(() => {
+    const bikeIdx = bikesData.ids[initialBikeId];
+    const bike = bikesData.bikes[bikeIdx];
+    if (bike) selectBike(bike);
+  });
 }
 
 searchResults.addEventListener('click', function(event) {
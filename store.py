@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""
+Datasheets by id (the file name without .json), parsed once.
+
+Parsed datasheets are kept in memory and in a cache file next to them, keyed
+by the size and modification time of each datasheet, so that a build or a
+bikes.py command only parses the datasheets that changed since the last one.
+Nothing is read until it is asked for.
+"""
+
+import json
+import os
+import pickle
+import unittest
+
+from atomic import atomic_write
+
+
+DATASHEET_DIR = 'datasheets'
+CACHE_FILE = '.datasheet_cache'
+
+# bump when what goes into the cache file changes
+CACHE_VERSION = 1
+
+
+class DatasheetStore:
+    def __init__(self, path=DATASHEET_DIR, cache_file=CACHE_FILE):
+        self.path = path
+        self.cache_file = cache_file
+        # file: (mtime_ns, size, data), None until first needed
+        self.records = None
+        self.changed = False
+
+    def file(self, id):
+        return os.path.join(self.path, f'{id}.json')
+
+    def ids(self):
+        """
+        Every datasheet but reference.json (the template for new ones),
+        sorted
+        """
+
+        with os.scandir(self.path) as items:
+            return sorted(
+                item.name[:-len('.json')] for item in items
+                if item.is_file() and item.name.endswith('.json')
+                and item.name != 'reference.json'
+            )
+
+    def get(self, id):
+        return self.read(self.file(id))
+
+    def read(self, file):
+        """
+        The parsed datasheet in file, which doesn't have to be in the store
+        directory. This is a copy of the top level of the datasheet only,
+        write it back rather than changing what's nested in it.
+        """
+
+        if self.records is None:
+            self.load()
+
+        file = os.path.normpath(file)
+        stat = os.stat(file)
+        record = self.records.get(file)
+
+        if record is None or record[:2] != (stat.st_mtime_ns, stat.st_size):
+            with open(file) as datasheet_file:
+                data = json.loads(datasheet_file.read())
+
+            record = (stat.st_mtime_ns, stat.st_size, data)
+            self.records[file] = record
+            self.changed = True
+
+        return dict(record[2])
+
+    def load(self):
+        self.records = {}
+
+        try:
+            with open(self.cache_file, 'rb') as file:
+                version, records = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, TypeError, ValueError):
+            return
+
+        if version == CACHE_VERSION:
+            self.records = records
+
+    def save(self):
+        """
+        Write the cache file, if anything was parsed since it was loaded
+        """
+
+        if not self.changed:
+            return
+
+        # datasheets that were removed since
+        records = {
+            file: record for file, record in self.records.items()
+            if os.path.exists(file)
+        }
+
+        with atomic_write(self.cache_file, 'wb') as file:
+            pickle.dump((CACHE_VERSION, records), file)
+
+        self.changed = False
+
+
+class DatasheetStoreTest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp.name, 'cache')
+
+        for id in ['b', 'a', 'reference']:
+            self.write(id, f'{{"make": "{id}"}}')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, id, contents):
+        with open(os.path.join(self.tmp.name, f'{id}.json'), 'w') as file:
+            file.write(contents)
+
+    def store(self):
+        return DatasheetStore(self.tmp.name, self.cache_file)
+
+    def test_ids(self):
+        self.assertEqual(self.store().ids(), ['a', 'b'])
+
+    def test_get(self):
+        store = self.store()
+        self.assertEqual(store.get('a'), {'make': 'a'})
+
+        store.get('a')['make'] = 'c'
+        self.assertEqual(store.get('a'), {'make': 'a'})
+
+    def test_parses_changed_only(self):
+        store = self.store()
+        store.get('a')
+        store.save()
+
+        # same size and time, so it can't have changed as far as the store
+        # knows, and comes from the cache file
+        stat = os.stat(store.file('a'))
+        self.write('a', '{"make": "x"}')
+        os.utime(store.file('a'), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(self.store().get('a'), {'make': 'a'})
+
+        self.write('a', '{"make": "xyz"}')
+        self.assertEqual(self.store().get('a'), {'make': 'xyz'})
+
+    def test_bad_cache_file(self):
+        with open(self.cache_file, 'w') as file:
+            file.write('not a pickle')
+
+        self.assertEqual(self.store().get('b'), {'make': 'b'})
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Where the time goes: wall time per named phase (datasheet load, kinematic
+solve, ...) accumulated across a run, and a cProfile wrapper for the
+--profile option of bikes.py and build.py.
+"""
+
+import cProfile
+import contextlib
+import io
+import logging
+import pstats
+import time
+import unittest
+
+
+# name: [seconds, times entered], in the order phases were first entered
+phases = {}
+
+
+@contextlib.contextmanager
+def phase(name):
+    totals = phases.setdefault(name, [0, 0])
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        totals[0] += time.perf_counter() - start
+        totals[1] += 1
+
+
+def report():
+    """
+    The phase timings as a table. Phases nest (a solve happens inside a
+    quantization...) so they don't add up to the total.
+    """
+
+    lines = [f'{"phase":<24} {"seconds":>10} {"calls":>8}']
+
+    for name, (seconds, calls) in phases.items():
+        lines.append(f'{name:<24} {seconds:>10.3f} {calls:>8}')
+
+    return '\n'.join(lines)
+
+
+def profile(function, path, *args):
+    """
+    Run function(*args) under cProfile, write the stats to path, and print
+    the top of them along with the phase table. Returns what function does.
+    """
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args)
+    profiler.dump_stats(path)
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(20)
+
+    print(stream.getvalue())
+    print(report())
+    print(f'\nprofile written to {path}')
+
+    return result
+
+
+def configure(args):
+    """
+    Set up logging from -v (info) or -vv (debug) and pull those flags, and
+    --profile[=path], out of args. Returns (args left, profile path or None).
+    """
+
+    level = logging.WARNING
+    path = None
+    rest = []
+
+    for arg in args:
+        if arg == '-v':
+            level = logging.INFO
+        elif arg == '-vv':
+            level = logging.DEBUG
+        elif arg == '--profile':
+            path = ''
+        elif arg.startswith('--profile='):
+            path = arg.split('=', 1)[1]
+        else:
+            rest.append(arg)
+
+    logging.basicConfig(level=level, format='%(name)s: %(message)s')
+
+    return rest, path
+
+
+class PhaseTest(unittest.TestCase):
+    def setUp(self):
+        phases.clear()
+
+    def test_phase(self):
+        for _ in range(3):
+            with phase('a'):
+                with phase('b'):
+                    pass
+
+        self.assertEqual([name for name in phases], ['a', 'b'])
+        self.assertEqual(phases['a'][1], 3)
+        self.assertGreaterEqual(phases['a'][0], phases['b'][0])
+        self.assertIn('a', report())
+
+    def test_phase_raises(self):
+        with self.assertRaises(ValueError):
+            with phase('a'):
+                raise ValueError()
+
+        self.assertEqual(phases['a'][1], 1)
+
+    def test_configure(self):
+        args, path = configure(['update_lev', '-v', '--profile=x.prof', 'a'])
+        self.assertEqual(args, ['update_lev', 'a'])
+        self.assertEqual(path, 'x.prof')